@@ -3,92 +3,230 @@
 This module wraps the boto SDK an offers the following value add to the application:
 
     1) simplify AWS responses and make them easier to use.
-    2) Use paginators when available and combine results.
+    2) Read paginated results and combine them.
     2) Automatically catch AWS exceptions and rethrow them as a custom exception
     3) Provide filtering options that are meaningful to the application
+    4) Offer asynchronous variants of the S3 and SNS functions so that callers
+       can issue many transfers or notifications concurrently
+
 """
+import asyncio
+import functools
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+from typing import Iterable, Union
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from exception.exceptions import ValidationError, AWSError
 from support import util, constants
 import logging
 
-log = logging.getLogger()
+log = logging.getLogger(__name__)
+
+# Multipart settings used for S3 file transfers. Large objects are split
+# into 8MB parts that are transferred in parallel.
+TRANSFER_CFG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=20,
+    use_threads=True
+)
+
+# Multipart settings used by the batch transfer functions. Each transfer
+# already runs on its own S3_POOL_MAX_WORKERS thread, so parts are transferred
+# sequentially rather than multiplying the number of threads (and pooled
+# connections) by max_concurrency
+BATCH_TRANSFER_CFG = TransferConfig(
+    multipart_threshold=TRANSFER_CFG.multipart_threshold,
+    multipart_chunksize=TRANSFER_CFG.multipart_chunksize,
+    use_threads=False
+)
+
+# Client configuration shared by all clients. The connection pool must be
+# larger than TRANSFER_CFG.max_concurrency or the multipart workers will wait
+# on each other, and adaptive retries back off client side when throttled.
+CLIENT_CFG = Config(
+    max_pool_connections=64,
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    tcp_keepalive=True
+)
+
+# Clients are created on first use, so that importing this module does not
+# require AWS credentials and processes only pay for the clients they use.
+# boto3's default session is not thread safe, hence the lock.
+_client_lock = threading.Lock()
+
+
+def _create_client(service_name: str):
+    '''
+        Creates a boto3 client using the shared client configuration
+    '''
+    try:
+        with _client_lock:
+            return boto3.client(service_name, config=CLIENT_CFG)
+    except Exception as e:
+        raise AWSError("Could not connect to AWS", e)
+
+
+@functools.lru_cache(maxsize=None)
+def _cf():
+    return _create_client('cloudformation')
+
+
+@functools.lru_cache(maxsize=None)
+def _s3():
+    return _create_client('s3')
+
+
+@functools.lru_cache(maxsize=None)
+def _sns():
+    return _create_client('sns')
+
+
+@functools.lru_cache(maxsize=None)
+def _cloudfront():
+    return _create_client('cloudfront')
+
+# The process umask, used to give streamed downloads the same permissions as
+# files created with open(). It can only be read by setting it, so it's read
+# once at import time rather than racing with other threads later
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+# Strings smaller than this are not worth compressing
+GZIP_MIN_SIZE_BYTES = 4096
+
+# The maximum number of messages accepted by a single SNS PublishBatch request
+SNS_MAX_BATCH_SIZE = 10
+
+# Number of threads used by the batch S3 transfer functions. Adding workers
+# beyond this point does not help, because the threads begin to contend on
+# botocore's internal locks. It must not exceed CLIENT_CFG.max_pool_connections
+S3_POOL_MAX_WORKERS = 32
+
 
-# Global clients available to this module]
-try:
-    CF_CLIENT = boto3.client('cloudformation')
-    S3_CLIENT = boto3.client('s3')
-    SNS_CLIENT = boto3.client('sns')
+@functools.lru_cache(maxsize=None)
+def _s3_pool():
+    '''
+        Thread pool shared by the batch S3 transfer functions, created on first use
+    '''
+    return ThreadPoolExecutor(max_workers=S3_POOL_MAX_WORKERS)
+
+# Extracts the stack name from a stack arn, e.g.
+# arn:aws:cloudformation:region:acct:stack/app-infra-base/c9481160-6df5-11ea-ac9f-121b58656156
+STACK_NAME_PATTERN = re.compile(r'stack/([^/]+)/')
 
-except Exception as e:
-    raise AWSError("Could not connect to AWS", e)
+# The application stacks, used to filter exports. frozenset() returns a
+# frozenset argument as is, so cf_list_exports does not rebuild it per call
+APP_CF_STACK_NAME_SET = frozenset(constants.APP_CF_STACK_NAMES)
 
-# A simple in memory cached used to reduce roundtrips to AWS
+# A simple in memory cached used to reduce roundtrips to AWS. Entries are
+# stored as (timestamp, value) tuples and expire after AWS_RESPONSE_CACHE_TTL
+# seconds. The lock ensures that concurrent callers perform a single lookup.
 # pylint: disable=invalid-name
+AWS_RESPONSE_CACHE_TTL = 300
 aws_response_cache = {}
+aws_response_cache_lock = threading.Lock()
 
+# SNS notification topic arns resolved by notify_error, keyed by app_ns
+sns_topic_arn_cache = {}
 
-def cf_list_exports(stack_name_filter: list):
-    '''
-        Reads all ClouFormation exports and returns only the ones
-        included in the stack_name_filter list
 
-        Parmeters
-        ---------
-        stack_name_filter : list
-            A list of strings representing the names of the stacks used as a filter
+def _load_all_exports():
+    '''
+        Reads all CloudFormation exports in the account and caches them.
+        Exports are account wide, so a single lookup can serve every filter.
 
         Returns
         ---------
-        A dictionary {export_name, export_value} with the filtered values. e.g.
-
-        {
-            'export-name-1': 'value1',
-            'export-name-2': 'value2',
-        }
+        A dictionary {export_name: (export_value, stack_name)}
     '''
+    # bound once so the export loop avoids a global and attribute lookup
+    search_stack_name = STACK_NAME_PATTERN.search
+
     def get_stackname_from_stackarn(arn: str):
+        match = search_stack_name(arn)
+        if match is None:
+            raise ValidationError("Could not parse stack ID from arn", arn)
+        return match.group(1)
+
+    key_name = 'all_cloudformation_exports'
+
+    with aws_response_cache_lock:
+        log.debug("looking for cached cloudformation exports")
+        cached_entry = aws_response_cache.get(key_name)
+        if cached_entry is None:
+            log.debug("Exports not found for %s. Looking them up", key_name)
+        else:
+            (cache_time, cached_exports) = cached_entry
+            if time.monotonic() - cache_time < AWS_RESPONSE_CACHE_TTL:
+                return cached_exports
+            log.debug("Cached exports for %s have expired. Looking them up", key_name)
+
+        all_exports = {}
 
-        # arn:aws:cloudformation:region:acct:stack/app-infra-base/c9481160-6df5-11ea-ac9f-121b58656156
         try:
-            arn_elements = arn.split(':')
-            stack_id = arn_elements[5]
+            # pages are requested directly rather than through a paginator
+            # to avoid its per page copying and result merging
+            next_token = None
+            while True:
+                if next_token is None:
+                    page = _cf().list_exports()
+                else:
+                    page = _cf().list_exports(NextToken=next_token)
 
-            stack_elements = stack_id.split("/")
-            return stack_elements[1]
-        except Exception as e:
-            raise ValidationError("Could not parse stack ID from arn", e)
+                for export in page['Exports']:
+                    stack_name = get_stackname_from_stackarn(
+                        export['ExportingStackId'])
+                    all_exports[export['Name']] = (export['Value'], stack_name)
 
-    if stack_name_filter is None:
-        stack_name_filter = []
+                next_token = page.get('NextToken')
+                if not next_token:
+                    break
 
-    return_dict = {}
+            aws_response_cache[key_name] = (time.monotonic(), all_exports)
 
-    key_name = 'get_stackname_from_stackarn'
+            return all_exports
 
-    try:
-        log.debug("looking for cached cloudformation exports")
-        return aws_response_cache[key_name]
-    except KeyError:
-        log.debug("Exports not found. Looking them up")
+        except Exception as e:
+            raise AWSError("Could not list Cloudformation exports", e)
 
-    try:
-        paginator = CF_CLIENT.get_paginator('list_exports')
-        response_iterator = paginator.paginate()
 
-        for page in response_iterator:
-            for export in page['Exports']:
-                stack_name = get_stackname_from_stackarn(
-                    export['ExportingStackId'])
-                if (stack_name in stack_name_filter):
-                    return_dict[export['Name']] = export['Value']
+def cf_list_exports(stack_name_filter: Iterable):
+    '''
+        Reads all ClouFormation exports and returns only the ones
+        included in the stack_name_filter list
 
-        aws_response_cache[key_name] = return_dict
+        Parmeters
+        ---------
+        stack_name_filter : Iterable
+            A list (or set) of strings representing the names of the stacks
+            used as a filter
 
-        return return_dict
+        Returns
+        ---------
+        A dictionary {export_name, export_value} with the filtered values. e.g.
 
-    except Exception as e:
-        raise AWSError("Could not list Cloudformation exports", e)
+        {
+            'export-name-1': 'value1',
+            'export-name-2': 'value2',
+        }
+    '''
+    filter_set = frozenset(stack_name_filter or ())
+
+    return {export_name: export_value
+            for export_name, (export_value, stack_name) in _load_all_exports().items()
+            if stack_name in filter_set}
 
 
 def cf_read_export_value(export_name: str):
@@ -96,9 +234,7 @@ def cf_read_export_value(export_name: str):
         Helper function to read the value of a specific CloudFormation export
         given the supplied export name
     '''
-    filter_list = constants.APP_CF_STACK_NAMES
-
-    app_cf_exports = cf_list_exports(filter_list)
+    app_cf_exports = cf_list_exports(APP_CF_STACK_NAME_SET)
     try:
         return app_cf_exports[export_name]
     except Exception:
@@ -106,50 +242,234 @@ def cf_read_export_value(export_name: str):
             "%s could not be found in clouformation exports." % export_name, None)
 
 
-def s3_download_object(bucket_name: str, object_name: str, dest_path: str):
+def _s3_stream_object(bucket_name: str, object_name: str, dest_path: str):
+    '''
+        Streams an s3 object into a temporary file that replaces the
+        destination path once the download is complete, so that a failed
+        download never leaves a truncated file behind
+    '''
+    (fd, temp_path) = tempfile.mkstemp(
+        dir=os.path.dirname(dest_path) or '.',
+        prefix='.%s.' % os.path.basename(dest_path))
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            response = _s3().get_object(Bucket=bucket_name, Key=object_name)
+            shutil.copyfileobj(response['Body'], temp_file, 64 * 1024)
+        # mkstemp creates owner-only files
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, dest_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def s3_download_object(bucket_name: str, object_name: str, dest_path: str, transfer_config: TransferConfig = TRANSFER_CFG):
     '''
         Downloads an s3 object to the local filesystem and saves it to
-        the destination path (path + filename)
+        the destination path (path + filename). Large objects are downloaded
+        according to the supplied transfer configuration
     '''
     try:
-        S3_CLIENT.download_file(bucket_name, object_name, dest_path)
+        object_size = _s3().head_object(
+            Bucket=bucket_name, Key=object_name)['ContentLength']
+
+        # Small objects are streamed with a single GET. Large ones are handed
+        # to the transfer manager for a multipart download
+        if object_size < transfer_config.multipart_threshold:
+            _s3_stream_object(bucket_name, object_name, dest_path)
+        else:
+            _s3().download_file(
+                bucket_name, object_name, dest_path, Config=transfer_config)
     except Exception as e:
         raise AWSError("Could not download s3://%s/%s --> %s" %
                        (bucket_name, object_name, dest_path), e)
 
 
-def s3_upload_object(source_path: str, bucket_name: str, object_name: str):
+def s3_upload_object(source_path: str, bucket_name: str, object_name: str, transfer_config: TransferConfig = TRANSFER_CFG):
     '''
         Uploads a file from the source_path (path + file) to the destination bucket
+        according to the supplied transfer configuration
     '''
     try:
-        S3_CLIENT.upload_file(source_path, bucket_name, object_name)
+        _s3().upload_file(
+            source_path, bucket_name, object_name, Config=transfer_config)
     except Exception as e:
         raise AWSError("Could not upload %s --> s3://%s/%s" %
                        (source_path, bucket_name, object_name), e)
 
 
-def s3_upload_ascii_string(object_contents: str, s3_bucket_name: str, s3_object_name: str):
+def _s3_transfer_many(transfer_function: object, transfers: list):
+    '''
+        Submits a list of transfers to the S3 thread pool and waits for all of
+        them to complete. Each transfer is a tuple containing the arguments
+        passed to the transfer function, which is also passed
+        BATCH_TRANSFER_CFG.
+
+        Raises an AWSError if any of the transfers failed
+    '''
+    futures = [_s3_pool().submit(transfer_function, *transfer, BATCH_TRANSFER_CFG)
+               for transfer in transfers]
+
+    errors = []
+    for future in as_completed(futures):
+        try:
+            future.result()
+        except Exception as e:
+            errors.append(e)
+
+    if len(errors) > 0:
+        raise AWSError("%d of %d S3 transfers failed" %
+                       (len(errors), len(transfers)), errors[0])
+
+
+def s3_download_many(bucket_name: str, transfers: list):
+    '''
+        Downloads multiple s3 objects concurrently
+
+        Parameters
+        ----------
+        bucket_name : str
+            The source bucket name
+        transfers : list
+            A list of (object_name, dest_path) tuples
+    '''
+    _s3_transfer_many(s3_download_object, [
+        (bucket_name, object_name, dest_path) for (object_name, dest_path) in transfers
+    ])
+
+
+def s3_upload_many(bucket_name: str, transfers: list):
+    '''
+        Uploads multiple files concurrently
+
+        Parameters
+        ----------
+        bucket_name : str
+            The destination bucket name
+        transfers : list
+            A list of (source_path, object_name) tuples
+    '''
+    _s3_transfer_many(s3_upload_object, [
+        (source_path, bucket_name, object_name) for (source_path, object_name) in transfers
+    ])
+
+
+def s3_upload_ascii_string(object_contents: Union[str, bytes], s3_bucket_name: str, s3_object_name: str, compress: bool = False, *, invalidate: tuple = None, content_type: str = 'text/plain; charset=us-ascii'):
     '''
         Uploads an ASCII string directly to S3, bypassing a local file.
+        Contents that are already encoded (bytes) are uploaded as is.
+
+        When compress is True, contents larger than GZIP_MIN_SIZE_BYTES are
+        gzipped and stored with "Content-Encoding: gzip". HTTP clients
+        (e.g. CloudFront) decompress these transparently, but
+        s3_download_object returns the compressed bytes.
+
+        When the object is served through CloudFront, invalidate may be set
+        to a (distribution_id, [paths]) tuple, and the paths will be
+        invalidated once the upload succeeds.
+
+        content_type is stored with the object, compressed or not, so that
+        browsers render it rather than treating it as binary/octet-stream.
     '''
     try:
-        S3_CLIENT.put_object(
-            Body=bytes(object_contents, 'ascii'),
+        if isinstance(object_contents, str):
+            object_contents = object_contents.encode('ascii')
+
+        put_args = {'ContentType': content_type}
+        if compress and len(object_contents) > GZIP_MIN_SIZE_BYTES:
+            object_contents = gzip.compress(object_contents, compresslevel=6)
+            put_args['ContentEncoding'] = 'gzip'
+
+        _s3().put_object(
+            Body=BytesIO(object_contents),
             Bucket=s3_bucket_name,
-            Key=s3_object_name
+            Key=s3_object_name,
+            **put_args
         )
     except Exception as e:
         raise AWSError("Could not upload String to s3://%s/%s" %
                        (s3_bucket_name, s3_object_name), e)
 
+    if invalidate is not None:
+        (distribution_id, paths) = invalidate
+        cloudfront_invalidate(distribution_id, paths)
+
+
+def cloudfront_invalidate(distribution_id: str, paths: list):
+    '''
+        Invalidates a list of paths (e.g. ['/portfolios/current-portfolio.json'])
+        in a CloudFront distribution, so that updated objects are served
+        immediately rather than when the cached copies expire.
+    '''
+    try:
+        _cloudfront().create_invalidation(
+            DistributionId=distribution_id,
+            InvalidationBatch={
+                'Paths': {
+                    'Quantity': len(paths),
+                    'Items': paths
+                },
+                'CallerReference': str(uuid.uuid4())
+            }
+        )
+    except Exception as e:
+        raise AWSError("Could not invalidate CloudFront distribution: %s" %
+                       distribution_id, e)
+
+
+def s3_select(bucket_name: str, object_name: str, sql_expression: str):
+    '''
+        Runs an S3 Select query against a JSON document stored in S3, so that
+        only the matching records are transferred rather than the whole object.
+
+        Parameters
+        ----------
+        bucket_name : str
+            The source bucket name
+        object_name : str
+            The name of the JSON object being queried
+        sql_expression : str
+            The S3 Select SQL expression, e.g.
+            "SELECT s.securities_set FROM S3Object s"
+
+        Returns
+        ----------
+        A generator yielding each matching record as a dictionary
+    '''
+    try:
+        response = _s3().select_object_content(
+            Bucket=bucket_name,
+            Key=object_name,
+            ExpressionType='SQL',
+            Expression=sql_expression,
+            InputSerialization={'JSON': {'Type': 'DOCUMENT'}},
+            OutputSerialization={'JSON': {'RecordDelimiter': '\n'}}
+        )
+
+        # records may be split across events, so only complete lines
+        # are decoded
+        pending = b''
+        for event in response['Payload']:
+            if 'Records' in event:
+                pending += event['Records']['Payload']
+                *records, pending = pending.split(b'\n')
+                for record in records:
+                    if record:
+                        yield json.loads(record)
+
+        if pending:
+            yield json.loads(pending)
+    except Exception as e:
+        raise AWSError("Could not select from s3://%s/%s" %
+                       (bucket_name, object_name), e)
+
 
 def sns_publish_notification(topic_arn: str, subject: str, message: str):
     '''
         Publishes a simple SNS message
     '''
     try:
-        SNS_CLIENT.publish(
+        _sns().publish(
             TopicArn=topic_arn,
             Message=message,
             Subject=subject
@@ -159,6 +479,80 @@ def sns_publish_notification(topic_arn: str, subject: str, message: str):
                        topic_arn, e)
 
 
+def sns_publish_batch(topic_arn: str, entries: list):
+    '''
+        Publishes multiple SNS messages using as few requests as possible.
+        Messages are sent in groups of SNS_MAX_BATCH_SIZE using PublishBatch.
+
+        Parameters
+        ----------
+        topic_arn: str
+            The SNS topic arn
+        entries: list
+            A list of (subject, message) tuples
+    '''
+    for batch_start in range(0, len(entries), SNS_MAX_BATCH_SIZE):
+        batch = entries[batch_start:batch_start + SNS_MAX_BATCH_SIZE]
+
+        try:
+            response = _sns().publish_batch(
+                TopicArn=topic_arn,
+                PublishBatchRequestEntries=[
+                    {
+                        'Id': str(i),
+                        'Subject': subject,
+                        'Message': message
+                    } for i, (subject, message) in enumerate(batch)
+                ]
+            )
+        except Exception as e:
+            raise AWSError("Cannot publish message batch to SNS topic: %s" %
+                           topic_arn, e)
+
+        if len(response.get('Failed', [])) > 0:
+            raise AWSError("Cannot publish message batch to SNS topic: %s" %
+                           topic_arn, response['Failed'])
+
+
+async def _run_async(func, *args, **kwargs):
+    '''
+        Runs a blocking function on the default executor and returns an
+        awaitable result. The boto3 clients are thread safe, so several of these
+        calls can be awaited concurrently using asyncio.gather
+    '''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+async def s3_download_object_async(bucket_name: str, object_name: str, dest_path: str):
+    '''
+        Asynchronous version of s3_download_object
+    '''
+    await _run_async(s3_download_object, bucket_name, object_name, dest_path)
+
+
+async def s3_upload_object_async(source_path: str, bucket_name: str, object_name: str):
+    '''
+        Asynchronous version of s3_upload_object
+    '''
+    await _run_async(s3_upload_object, source_path, bucket_name, object_name)
+
+
+async def s3_upload_ascii_string_async(object_contents: Union[str, bytes], s3_bucket_name: str, s3_object_name: str, compress: bool = False, *, invalidate: tuple = None, content_type: str = 'text/plain; charset=us-ascii'):
+    '''
+        Asynchronous version of s3_upload_ascii_string
+    '''
+    await _run_async(s3_upload_ascii_string, object_contents, s3_bucket_name, s3_object_name, compress,
+                     invalidate=invalidate, content_type=content_type)
+
+
+async def sns_publish_notification_async(topic_arn: str, subject: str, message: str):
+    '''
+        Asynchronous version of sns_publish_notification
+    '''
+    await _run_async(sns_publish_notification, topic_arn, subject, message)
+
+
 def notify_error(exception: object, service_name: str, stack_trace: str, app_ns: str):
     '''
         Sends an SNS notification indicating that an error prevented the service from running
@@ -175,13 +569,14 @@ def notify_error(exception: object, service_name: str, stack_trace: str, app_ns:
             The application namespace supplied to the command line
             used to identify the appropriate CloudFormation exports
     '''
-    sns_topic_arn = cf_read_export_value(
-        constants.sns_app_notifications_topic_arn(app_ns))
-    subject = "%s Error" % service_name
-    message = "There was an error running the %s: %s\n\n%s" % \
-        (service_name, str(exception), stack_trace)
-
-    log.info("Publishing error event to SNS topic: %s" %
-             sns_topic_arn)
+    sns_topic_arn = sns_topic_arn_cache.get(app_ns)
+    if sns_topic_arn is None:
+        sns_topic_arn = cf_read_export_value(
+            constants.sns_app_notifications_topic_arn(app_ns))
+        sns_topic_arn_cache[app_ns] = sns_topic_arn
+    subject = f"{service_name} Error"
+    message = f"There was an error running the {service_name}: {exception}\n\n{stack_trace}"
+
+    log.info("Publishing error event to SNS topic: %s", sns_topic_arn)
     sns_publish_notification(
         sns_topic_arn, subject, message)
@@ -3,25 +3,98 @@
     Yahoo Finance connector. This class offers various API wrappers to the
     service, and can enrich pricing data to generate various indicators. 
     
-    It leverages the "yfinance" library to integract with Yahoo and "stock-pandas"
-    to enrich the data.
+    It leverages the "yfinance" library to integract with Yahoo and enriches
+    the data with precomputed indicator columns.
 """
 
 import yfinance as yf
+import functools
 import logging
+import numpy as np
 import pandas as pd
-from stock_pandas import StockDataFrame
+import requests
+from requests.adapters import HTTPAdapter
 from datetime import date, datetime, timedelta
 from exception.exceptions import DataError, ValidationError
 from support.financial_cache import cache
 
+try:
+  from numba import njit, guvectorize
+except ImportError:
+  # numba is optional. Without it the indicator kernels run as plain python
+  def njit(*args, **kwargs):
+    if len(args) == 1 and callable(args[0]):
+      return args[0]
+    return lambda function: function
+
+  def guvectorize(*args, **kwargs):
+    # only supports the '(n),()->(n)' layout used by this module
+    def vectorize(kernel):
+      def ufunc(values, scalar):
+        values = np.asarray(values)
+        out = np.empty_like(values)
+        for row in np.ndindex(values.shape[:-1]):
+          kernel(values[row], scalar, out[row])
+        return out
+      return ufunc
+    return vectorize
+
+try:
+  from curl_cffi import requests as curl_requests
+except ImportError:
+  # recent versions of yfinance need curl_cffi to impersonate a browser.
+  # Older versions work with a plain requests session
+  curl_requests = None
+
 log = logging.getLogger()
 
 
 YFINANCE_CACHE_PREFIX = 'yfinance'
 
+# Number of prices used by get_latest_macd() to compute the MACD line, and
+# number of MACD values used to compute the signal line
+MACD_TAIL_LENGTH = 200
+MACD_SIGNAL_TAIL_LENGTH = 80
+
+# MACD periods that are precomputed and cached with every pricing dataframe
+DEFAULT_MACD_FAST_PERIOD = 12
+DEFAULT_MACD_SLOW_PERIOD = 26
+DEFAULT_MACD_SIGNAL_PERIOD = 9
+
+# Price columns stored as float32. Volume is left alone since share counts
+# routinely exceed the range of integers that float32 can represent exactly
+FLOAT32_PRICE_COLUMNS = ('Open', 'High', 'Low', 'Close')
+
+# Lightweight endpoint used to validate connectivity. Unlike the quote
+# endpoint, the chart endpoint does not require a crumb
+YAHOO_HEALTH_CHECK_URL = 'https://query1.finance.yahoo.com/v8/finance/chart/SPY'
+
+# Columns kept when prices are loaded with close_only=True
+CLOSE_ONLY_COLUMNS = ['Close',
+                      'macd_%d_%d' % (DEFAULT_MACD_FAST_PERIOD, DEFAULT_MACD_SLOW_PERIOD),
+                      'macd_signal_%d_%d_%d' % (DEFAULT_MACD_FAST_PERIOD, DEFAULT_MACD_SLOW_PERIOD,
+                                                DEFAULT_MACD_SIGNAL_PERIOD)]
+
+# Size of the connection pool used when the session is a requests session
+HTTP_POOL_SIZE = 32
+
+
+@functools.lru_cache(maxsize=None)
+def _session():
+    '''
+      Returns the HTTP session shared by all yfinance requests, so that
+      connections are kept alive and reused across tickers
+    '''
+    if curl_requests is not None:
+      # curl keeps its connections alive for the life of the session
+      return curl_requests.Session(impersonate="chrome")
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
-#pd.set_option("display.max_rows", None, "display.max_columns", None)
 
 def test_api_endpoint():
     """
@@ -29,23 +102,157 @@ def test_api_endpoint():
       anything goes wrong. 
       This is used to validate connetivity to the Yahoo Finance service
     """
-    ticker_symbol = "SPY"
     try:
-      yf.Ticker(ticker_symbol).info
+      _session().head(YAHOO_HEALTH_CHECK_URL, timeout=5).raise_for_status()
     except Exception as e:
-      raise DataError("Could not read %s ticker info" % ticker_symbol, e)
+      raise DataError("Could not connect to Yahoo Finance (%s)" % YAHOO_HEALTH_CHECK_URL, e)
+
+
+@functools.lru_cache(maxsize=256)
+def date_to_string(date: date):
+    """
+      returns a string representation of a date that is usable by the yfinance API.
+      The same few dates are converted for every ticker, so results are memoized
+
+      Returns
+      ----------
+      A string formatted as YYYY-MM-DD
+    """
+    return date.strftime("%Y-%m-%d")
+
+
+def _price_request(ticker: str, price_start: date, price_end: date):
+    '''
+      Returns the (start, end, cache_key) used to request and cache a range
+      of prices. yfinance treats the end date as exclusive, so one day is
+      added to it.
+    '''
+    start = date_to_string(price_start)
+    end = date_to_string(price_end + timedelta(days=1))
+
+    cache_key = (YFINANCE_CACHE_PREFIX, ticker, start, end, "prices")
+
+    return (start, end, cache_key)
 
 
-def get_enriched_prices(ticker: str, price_start : datetime, price_end: datetime):
+def _read_cached_prices(cache_key: tuple, close_only: bool = False):
     '''
-      Returns a pricing data frame based on the yfinance API and enriched using
-      the stock-pandas library. 
-      
-      https://pypi.org/project/stock-pandas/
+      Returns a previously loaded pricing dataframe, or None if it cannot be found.
+      When close_only is set, only the CLOSE_ONLY_COLUMNS are read from the cache.
+    '''
+    price_df = cache.read_df(cache_key, CLOSE_ONLY_COLUMNS if close_only else None)
+    if price_df is None:
+      return None
+
+    if not _is_current(price_df):
+      # entries cached by older versions of this module are upgraded once
+      # and written back. This needs every column, not just the selected ones
+      if close_only:
+        price_df = cache.read_df(cache_key)
+      price_df = _add_default_indicators(
+        _downcast_prices(_normalize_index(price_df)))
+      cache.write_df(cache_key, price_df)
+      price_df = _select_columns(price_df, close_only)
+
+    return price_df
+
+
+def _is_current(price_df: pd.DataFrame):
+    '''
+      Returns True if a cached pricing dataframe has the index, dtypes and
+      indicator columns produced by _cache_prices()
+    '''
+    index = price_df.index
+    if isinstance(index, pd.DatetimeIndex) and (index.tz is not None or not index.is_normalized):
+      return False
+
+    for col in FLOAT32_PRICE_COLUMNS:
+      if col in price_df.columns and price_df[col].dtype != np.float32:
+        return False
+
+    return all(col in price_df.columns for col in CLOSE_ONLY_COLUMNS)
+
+
+def _cache_prices(cache_key: tuple, history_df: pd.DataFrame):
+    '''
+      Stores a price history downloaded from Yahoo in the financial cache
+
+      Returns
+      ----------
+      The enriched pricing dataframe
+    '''
+    price_df = _add_default_indicators(
+      _downcast_prices(_normalize_index(history_df.copy())))
+    cache.write_df(cache_key, price_df)
+    return price_df
+
+
+def _normalize_index(price_df: pd.DataFrame):
+    '''
+      Converts the index of a pricing dataframe to timezone naive dates.
+      Ticker.history() returns dates in the exchange timezone while
+      yf.download() returns naive dates, and both are stored under the
+      same cache key, so they must be comparable.
+    '''
+    index = price_df.index
+    if not isinstance(index, pd.DatetimeIndex):
+      return price_df
+
+    if index.tz is not None:
+      index = index.tz_localize(None)
+    if not index.is_normalized:
+      index = index.normalize()
+
+    if index is not price_df.index:
+      price_df.index = index
+    return price_df
+
+
+def _downcast_prices(price_df: pd.DataFrame):
+    '''
+      Converts the price columns of a dataframe to float32, which halves the
+      memory used by the prices and the indicators computed from them
+    '''
+    for col in FLOAT32_PRICE_COLUMNS:
+      if col in price_df.columns and price_df[col].dtype != np.float32:
+        price_df[col] = price_df[col].astype(np.float32)
+
+    return price_df
+
+
+def _add_default_indicators(price_df: pd.DataFrame):
+    '''
+      Adds the indicator columns that are precomputed for every pricing
+      dataframe
+    '''
+    return add_macd_columns(price_df, DEFAULT_MACD_FAST_PERIOD,
+                            DEFAULT_MACD_SLOW_PERIOD, DEFAULT_MACD_SIGNAL_PERIOD)
+
+
+def _select_columns(price_df: pd.DataFrame, close_only: bool):
+    '''
+      Returns the columns of a freshly downloaded or upgraded pricing
+      dataframe requested by the caller. Cached dataframes are read with
+      only the requested columns, see _read_cached_prices(). The cache
+      itself always holds the full dataframe.
+    '''
+    if not close_only:
+      return price_df
+
+    return price_df[CLOSE_ONLY_COLUMNS]
+
+
+def get_enriched_prices(ticker: str, price_start : datetime, price_end: datetime, close_only: bool = False):
+    '''
+      Returns a pricing data frame based on the yfinance API and enriched with
+      the default MACD indicators.
 
       The dataframe contains these colums
 
-      ['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits']
+      ['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits',
+       'macd_12_26', 'macd_signal_12_26_9']
+
+      or only ['Close', 'macd_12_26', 'macd_signal_12_26_9'] when close_only is set
 
       Parameters
       ----------
@@ -55,41 +262,286 @@ def get_enriched_prices(ticker: str, price_start : datetime, price_end: datetime
         The beginning price date as python date object
       end_date : object
         The end price date as python date object
+      close_only : bool
+        (optional) drop the columns that aren't needed by indicators based on
+        closing prices, so that callers holding on to many dataframes,
+        e.g. PricingSvc, only keep those columns
     '''
-    def date_to_string(date: date):
-      """
-        returns a string representation of a date that is usable by the intrinio API
+    (start, end, cache_key) = _price_request(ticker, price_start, price_end)
 
-        Returns
-        ----------
-        A string formatted as YYYY-MM-DD. This is the format used by most Intrinio APIs
-      """
-      return date.strftime("%Y-%m-%d")
+    price_df = _read_cached_prices(cache_key, close_only)
+    if price_df is not None:
+      return price_df
 
-    start = date_to_string(price_start)
-    end = date_to_string(price_end + timedelta(days=1))
+    try:
+      yf_ticker = yf.Ticker(ticker, session=_session())
+      history_df = yf_ticker.history(start=start, end=end)
+    except Exception as e:
+      raise DataError("Could not read prices from Yahoo (start_date=%s, end_date=%s)" % (start, end), e)
+
+    if history_df.empty:
+      raise DataError("Could not read %s prices from Yahoo (start_date=%s, end_date=%s)" % (ticker, start, end), None)
+
+    return _select_columns(_cache_prices(cache_key, history_df), close_only)
+
+
+def get_enriched_prices_bulk(tickers: list, price_start: datetime, price_end: datetime, close_only: bool = False):
+    '''
+      Bulk version of get_enriched_prices(). Prices that are not already cached
+      are downloaded for all tickers using a single yfinance request.
+
+      Parameters
+      ----------
+      tickers : list
+        List of ticker symbols
+      start_date : object
+        The beginning price date as python date object
+      end_date : object
+        The end price date as python date object
+      close_only : bool
+        (optional) see get_enriched_prices()
+
+      Returns
+      ----------
+      A dictionary of {ticker: pricing dataframe}
+    '''
+    price_dict = {}
+    missing_tickers = {}
 
-    cache_key = "%s-%s-%s-%s-%s" % (YFINANCE_CACHE_PREFIX,
-                                  ticker, start, end, "prices")
+    for ticker in tickers:
+      (start, end, cache_key) = _price_request(ticker, price_start, price_end)
 
-    price_df_json = cache.read(cache_key)
+      price_df = _read_cached_prices(cache_key, close_only)
+      if price_df is None:
+        missing_tickers[ticker] = cache_key
+      else:
+        price_dict[ticker] = price_df
 
-    if price_df_json is None:
+    if len(missing_tickers) == 0:
+      return price_dict
+
+    log.info("Downloading prices for %d tickers" % len(missing_tickers))
+
+    try:
+      # auto_adjust and actions match the columns returned by Ticker.history()
+      download_df = yf.download(list(missing_tickers.keys()), start=start, end=end,
+                                group_by='ticker', auto_adjust=True, actions=True,
+                                threads=True, progress=False, session=_session())
+    except Exception as e:
+      raise DataError("Could not read prices from Yahoo (start_date=%s, end_date=%s)" % (start, end), e)
+
+    for (ticker, cache_key) in missing_tickers.items():
       try:
-        yf_ticker = yf.Ticker(ticker)
-        price_df = StockDataFrame(yf_ticker.history(start=start, end=end))
-        cache.write(cache_key, price_df.to_json())
+        if isinstance(download_df.columns, pd.MultiIndex):
+          history_df = download_df[ticker]
+        else:
+          history_df = download_df
+        # rows are aligned across tickers, so drop the dates this ticker did not trade
+        history_df = history_df.dropna(how='all')
       except Exception as e:
-        raise DataError("Could not read prices from Yahoo (start_date=%, end_date=%s)" % (start_date, end_date), e)
+        raise DataError("Could not read %s prices from Yahoo (start_date=%s, end_date=%s)" % (ticker, start, end), e)
+
+      if history_df.empty:
+        raise DataError("Could not read %s prices from Yahoo (start_date=%s, end_date=%s)" % (ticker, start, end), None)
+
+      price_dict[ticker] = _select_columns(
+        _cache_prices(cache_key, history_df), close_only)
+
+    return price_dict
+
+
+@njit(cache=True)
+def _ema(values: np.ndarray, alpha: float):
+  '''
+    Computes an exponential moving average using the recurrence
+
+    ema[i] = alpha * values[i] + (1 - alpha) * ema[i - 1]
+
+    seeded with the first value. This is the same as pandas' ewm(adjust=False)
+  '''
+  ema = np.empty_like(values)
+  if values.shape[0] == 0:
+    return ema
+
+  ema[0] = values[0]
+  for i in range(1, values.shape[0]):
+    ema[i] = alpha * values[i] + (1 - alpha) * ema[i - 1]
+  return ema
+
+
+@functools.lru_cache(maxsize=64)
+def _ema_tail_weights(alpha: float, tail_len: int):
+  '''
+    Returns the weights w such that np.dot(w, values) equals the last
+    element of _ema(values, alpha), where values has tail_len + 1 elements:
+
+    w = [(1 - alpha)^t, alpha * (1 - alpha)^(t - 1), ..., alpha * (1 - alpha), alpha]
+  '''
+  decay = 1 - alpha
+  weights = alpha * decay ** np.arange(tail_len, -1, -1, dtype=np.float64)
+  weights[0] = decay ** tail_len
+
+  # the array is shared by all callers
+  weights.flags.writeable = False
+  return weights
+
+
+def _ema_row(values: np.ndarray, alpha: float, ema: np.ndarray):
+  '''
+    Kernel used by ema_matrix(). Same as _ema(), except that NaN values are
+    skipped: leading NaNs are copied and a NaN in the middle of the series
+    carries the previous average forward.
+  '''
+  if values.shape[0] == 0:
+    return
+
+  ema[0] = values[0]
+  for i in range(1, values.shape[0]):
+    if np.isnan(ema[i - 1]):
+      ema[i] = values[i]
+    elif np.isnan(values[i]):
+      ema[i] = ema[i - 1]
     else:
-      price_df = StockDataFrame(pd.read_json(price_df_json))
+      ema[i] = alpha * values[i] + (1 - alpha) * ema[i - 1]
 
-    price_df.alias('close', 'Close')
-    return price_df
+
+@functools.lru_cache(maxsize=None)
+def _ema_ufunc():
+  '''
+    Compiles _ema_row() into a parallel generalized ufunc the first time
+    it's needed
+  '''
+  return guvectorize(
+    ['void(float32[:], float32, float32[:])', 'void(float64[:], float64, float64[:])'],
+    '(n),()->(n)', nopython=True, target='parallel')(_ema_row)
+
+
+def ema_matrix(values: np.ndarray, alpha: float):
+  '''
+    Computes the exponential moving average of each row of a matrix, e.g.
+    PricingSvc.close_prices, in a single call. Rows are processed in
+    parallel. See _ema_row() for how NaN values are handled.
+
+    Returns
+    ----------
+    A matrix of the same shape and dtype as values
+  '''
+  values = np.asarray(values)
+  return _ema_ufunc()(values, values.dtype.type(alpha))
+
+
+def get_macd_matrix(close: np.ndarray, fast_period: int, slow_period: int, signal_period: int):
+  '''
+    Computes the MACD and MACD signal for a matrix of closing prices, one row
+    per ticker. Dates where a ticker has no price are NaN in both results.
+
+    Returns
+    ----------
+    A tuple of (macd, signal) matrices, shaped like close
+  '''
+  missing_prices = np.isnan(close)
+
+  macd = ema_matrix(close, 2 / (fast_period + 1)) - \
+    ema_matrix(close, 2 / (slow_period + 1))
+  macd[missing_prices] = np.nan
+
+  signal = ema_matrix(macd, 2 / (signal_period + 1))
+  signal[missing_prices] = np.nan
+
+  return (macd, signal)
+
+
+def _ema_tail(values: np.ndarray, alpha: float, tail_len: int):
+  '''
+    Returns the exponential moving average of the last tail_len + 1 values.
+    values may also be a 2D array of windows, one per row, in which case
+    the average of each window is returned.
+  '''
+  return np.dot(values[..., -(tail_len + 1):], _ema_tail_weights(alpha, tail_len))
+
+
+def get_latest_macd(close: np.ndarray, fast_period: int, slow_period: int, signal_period: int):
+  '''
+    Returns the MACD and MACD signal values for the last element of an
+    array of closing prices without computing the full MACD series.
+
+    The averages are computed over the last MACD_TAIL_LENGTH prices (and
+    MACD_SIGNAL_TAIL_LENGTH MACD values), which is long enough for the
+    contribution of older prices to be negligible.
+
+    Returns
+    ----------
+    A tuple of (macd, signal) values
+  '''
+  close = np.asarray(close, dtype=np.float64)
+
+  signal_tail_len = max(0, min(MACD_SIGNAL_TAIL_LENGTH, (len(close) - 1) // 2))
+  macd_tail_len = min(MACD_TAIL_LENGTH, len(close) - 1 - signal_tail_len)
+
+  # one window of prices for each of the MACD values used by the signal
+  windows = np.lib.stride_tricks.sliding_window_view(
+    close, macd_tail_len + 1)[-(signal_tail_len + 1):]
+
+  macd = _ema_tail(windows, 2 / (fast_period + 1), macd_tail_len) - \
+    _ema_tail(windows, 2 / (slow_period + 1), macd_tail_len)
+  signal = _ema_tail(macd, 2 / (signal_period + 1), signal_tail_len)
+
+  return (macd[-1], signal)
+
+
+def add_macd_columns(price_df: pd.DataFrame, fast_period: int, slow_period: int, signal_period: int):
+  '''
+    Adds the MACD and MACD signal columns to a pricing dataframe, unless
+    they are already present. The column names are returned by
+    get_macd_column() and get_macd_signal_column()
+
+    Returns
+    ----------
+    The same dataframe, with the added columns
+  '''
+  macd_col = get_macd_column(fast_period, slow_period)
+  signal_col = get_macd_signal_column(fast_period, slow_period, signal_period)
+
+  if macd_col not in price_df.columns:
+    close = price_df['Close'].to_numpy(dtype=np.float64)
+    price_df[macd_col] = _ema(close, 2 / (fast_period + 1)) - \
+      _ema(close, 2 / (slow_period + 1))
+
+  if signal_col not in price_df.columns:
+    macd = price_df[macd_col].to_numpy(dtype=np.float64)
+    price_df[signal_col] = _ema(macd, 2 / (signal_period + 1))
+
+  return price_df
+
+
+def macd_crossovers(price_df: pd.DataFrame, fast_period: int, slow_period: int, signal_period: int):
+  '''
+    Returns the positions of the rows where the MACD line crosses its signal
+    line, i.e. where the sign of (macd - signal) differs from the previous row.
+    The MACD columns are added to the dataframe if they are missing.
+
+    Returns
+    ----------
+    A numpy array of integer row positions
+  '''
+  add_macd_columns(price_df, fast_period, slow_period, signal_period)
+
+  diff = price_df[get_macd_column(fast_period, slow_period)].to_numpy() - \
+    price_df[get_macd_signal_column(fast_period, slow_period, signal_period)].to_numpy()
+
+  return np.where(np.diff(np.signbit(diff)))[0] + 1
 
 
 def get_macd_column(fast_period: int, slow_perdiod: int):
-  return "macd:%d,%d" % (fast_period, slow_perdiod) 
+  '''
+    Returns the name of the MACD column. Dataframes returned by
+    get_enriched_prices() always contain the column for the default periods;
+    other periods are added by add_macd_columns()
+  '''
+  return "macd_%d_%d" % (fast_period, slow_perdiod)
 
 def get_macd_signal_column(fast_period: int, slow_perdiod: int, signal_period: int):
-  return "macd.signal:%d,%d,%d" % (fast_period, slow_perdiod, signal_period) 
\ No newline at end of file
+  '''
+    Returns the name of the MACD signal column. See get_macd_column()
+  '''
+  return "macd_signal_%d_%d_%d" % (fast_period, slow_perdiod, signal_period)
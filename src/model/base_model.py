@@ -116,4 +116,5 @@ class BaseModel(ABC):
         log.info("Uploading %s to S3: s3://%s/%s" %
                  (self.model_name, s3_data_bucket_name, s3_object_path))
         aws_service_wrapper.s3_upload_ascii_string(
-            util.format_dict(self.model), s3_data_bucket_name, s3_object_path)
+            util.format_dict(self.model), s3_data_bucket_name, s3_object_path,
+            content_type='application/json')
@@ -15,10 +15,12 @@ from test.test_connectors_aws_service_wrapper import TestConnectorsAWSServiceWra
 from test.test_connectors_td_ameritrade import TestConnectorsTDAmeritrade
 from test.test_connectors_intrinio_util import TestConnectorsIntrinioUtil
 from test.test_connectors_intrinio_data import TestConnectorsIntrinioData
+from test.test_connectors_yfinance_data import TestConnectorsYFinanceData
 from test.test_connector_connector_test import TestConnectorsTest
 from test.test_services_recommendation import TestServicesRecommendation
 from test.test_services_portfolio_mgr import TestServicePortfolioManager
 from test.test_services_broker import TestBroker
+from test.test_services_pricing import TestServicesPricing
 from test.test_model_ticker_list import TestModelTickerList
 from test.test_model_recommendation_set import TestSecurityRecommendationSet
 from test.test_model_base_model import TestBaseModel
@@ -2,6 +2,9 @@
 """
 
 import logging
+import threading
+import numpy as np
+import pandas as pd
 from datetime import date
 import connectors.yfinance_data as yfinance
 
@@ -17,8 +20,22 @@ class PricingSvc():
 
     pricing_dict = {}
 
+    # Prices may be loaded from multiple threads
+    pricing_dict_lock = threading.Lock()
+
+    # Columnar view of the closing prices built by finalize(). close_prices
+    # has one row per ticker and one column per date in price_dates, and
+    # ticker_index maps each ticker symbol to its row.
+    close_prices = None
+    price_dates = None
+    ticker_index = {}
+
+    # MACD and MACD signal matrices, shaped like close_prices and keyed by
+    # (fast_period, slow_period, signal_period)
+    macd_dict = {}
+
     @classmethod
-    def load_financial_data(cls, ticker_symbol: str, start_date: date, end_date: date):
+    def load_financial_data(cls, ticker_symbol: str, start_date: date, end_date: date, close_only: bool = False):
         '''
             Loads a range of prices for a ticker symbol and caches them in memory.
             If prices already exist, they will be overwritten.
@@ -31,6 +48,9 @@ class PricingSvc():
                 xxx
             end_date: date
                 xxx
+            close_only: bool
+                (optional) only keep the closing prices and the indicators
+                computed from them
 
             Returns
             ----------
@@ -38,10 +58,49 @@ class PricingSvc():
         '''
 
         log.info("Loading Prices for ticker: %s, from: %s, to: %s" % (ticker_symbol, start_date, end_date))
-        cls.pricing_dict[ticker_symbol] = yfinance.get_enriched_prices(
-                ticker_symbol, start_date, end_date)
+        price_df = yfinance.get_enriched_prices(
+                ticker_symbol, start_date, end_date, close_only)
+
+        with cls.pricing_dict_lock:
+            cls.pricing_dict[ticker_symbol] = price_df
+
+        return price_df
+
+
+    @classmethod
+    def load_financial_data_bulk(cls, ticker_symbols: list, start_date: date, end_date: date, close_only: bool = False):
+        '''
+            Loads a range of prices for a list of ticker symbols and caches them
+            in memory. Prices that are not already cached are downloaded
+            using a single request.
+            If prices already exist, they will be overwritten.
+
+            Parameters
+            ----------
+            ticker_symbols: list
+                List of ticker symbols
+            start_date: date
+                The beginning price date
+            end_date: date
+                The end price date
+            close_only: bool
+                (optional) only keep the closing prices and the indicators
+                computed from them
+
+            Returns
+            ----------
+            Returns a dictionary of {ticker_symbol: pricing dataframe} with the
+            prices that were just loaded
+        '''
+
+        log.info("Loading Prices for %d tickers, from: %s, to: %s" % (len(ticker_symbols), start_date, end_date))
+        price_dict = yfinance.get_enriched_prices_bulk(
+                ticker_symbols, start_date, end_date, close_only)
+
+        with cls.pricing_dict_lock:
+            cls.pricing_dict.update(price_dict)
 
-        return cls.pricing_dict
+        return price_dict
 
 
     @classmethod
@@ -50,4 +109,94 @@ class PricingSvc():
             Returns the currently available pricing dataframe, or None if
             one does not exist
         '''
-        return cls.pricing_dict.get(ticker_symbol, None)
\ No newline at end of file
+        return cls.pricing_dict.get(ticker_symbol, None)
+
+
+    @classmethod
+    def finalize(cls):
+        '''
+            Builds the columnar closing price matrix from all loaded tickers.
+            Prices are aligned on the union of all price dates, so a ticker
+            that did not trade on a given date will have a NaN price.
+
+            This method should be called after all prices are loaded.
+        '''
+        with cls.pricing_dict_lock:
+            ticker_symbols = list(cls.pricing_dict.keys())
+            close_series = [cls.pricing_dict[ticker_symbol]['Close']
+                            for ticker_symbol in ticker_symbols]
+
+        cls.macd_dict = {}
+
+        if len(ticker_symbols) == 0:
+            cls.close_prices = np.empty((0, 0), dtype=np.float32)
+            cls.price_dates = pd.DatetimeIndex([])
+            cls.ticker_index = {}
+            return
+
+        # the dates must be sorted for searchsorted() and the EMA kernels
+        close_df = pd.concat(close_series, axis=1, join='outer',
+                             keys=ticker_symbols, sort=True)
+
+        cls.close_prices = np.ascontiguousarray(
+            close_df.to_numpy(dtype=np.float32).T)
+        cls.price_dates = close_df.index
+        cls.ticker_index = {ticker_symbol: i for (
+            i, ticker_symbol) in enumerate(ticker_symbols)}
+
+
+    @classmethod
+    def get_close_prices(cls, ticker_symbol: str):
+        '''
+            Returns the array of closing prices built by finalize(), aligned
+            with price_dates, or None if the ticker is not available
+        '''
+        row = cls.ticker_index.get(ticker_symbol, None)
+        if row is None:
+            return None
+        return cls.close_prices[row]
+
+
+    @classmethod
+    def load_macd(cls, fast_period: int, slow_period: int, signal_period: int):
+        '''
+            Computes the MACD and MACD signal for all tickers in the closing
+            price matrix at once. Must be called after finalize().
+
+            The prices are upcast to float64 so that the results match the
+            columns added by yfinance_data.add_macd_columns()
+        '''
+        cls.macd_dict[(fast_period, slow_period, signal_period)] = yfinance.get_macd_matrix(
+            cls.close_prices.astype(np.float64), fast_period, slow_period, signal_period)
+
+
+    @classmethod
+    def get_macd(cls, ticker_symbol: str, price_date: date, fast_period: int, slow_period: int, signal_period: int):
+        '''
+            Returns the MACD values computed by load_macd() for a ticker
+            and price date
+
+            Returns
+            ----------
+            A tuple of (macd, signal) values, or None if they were not computed
+        '''
+        macd_matrices = cls.macd_dict.get((fast_period, slow_period, signal_period))
+        row = cls.ticker_index.get(ticker_symbol, None)
+
+        if macd_matrices is None or row is None:
+            return None
+
+        price_timestamp = pd.Timestamp(price_date)
+        if cls.price_dates.tz is not None:
+            # prices read directly from Ticker.history() are in the exchange timezone
+            price_timestamp = price_timestamp.tz_localize(cls.price_dates.tz)
+
+        col = cls.price_dates.searchsorted(price_timestamp)
+        if col >= len(cls.price_dates) or cls.price_dates[col] != price_timestamp:
+            return None
+
+        (macd, signal) = macd_matrices
+        if np.isnan(macd[row, col]):
+            return None
+
+        return (float(macd[row, col]), float(signal[row, col]))
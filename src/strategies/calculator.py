@@ -3,9 +3,10 @@
 This module contains a collection of calculations shared by the trading
 strategies contained in this package.
 """
+import numpy as np
 import pandas as pd
 from datetime import date
-from connectors import intrinio_data
+from connectors import yfinance_data
 from exception.exceptions import ValidationError, CalculationError, DataError
 
 
@@ -22,6 +23,9 @@ def mark_to_market(data_frame: object, ticker_col_name: str, price_col_name: str
         * current_price
         * actual_return
 
+        current_price is Yahoo's split and dividend adjusted close on the
+        price date, converted to float64.
+
         Parmeters
         ---------
         data_frame: Pandas DataFrame
@@ -48,18 +52,29 @@ def mark_to_market(data_frame: object, ticker_col_name: str, price_col_name: str
         raise ValidationError(
             "Could not extract required fields for Mark to Market calculation", None)
 
-    mmt_prices = []
+    tickers = data_frame[ticker_col_name].tolist()
+    date_key = price_date.strftime("%Y-%m-%d")
+
+    # All prices are read with a single request. Duplicate tickers are only
+    # requested once
+    try:
+        price_dict = yfinance_data.get_enriched_prices_bulk(
+            list(dict.fromkeys(tickers)), price_date, price_date, close_only=True)
+
+        # cached prices are stored as float32
+        mmt_prices = {ticker: float(price_df.loc[date_key, 'Close'])
+                      for (ticker, price_df) in price_dict.items()}
+    except Exception as e:
+        raise DataError("Could not perform MMT calculation", e)
 
-    for ticker in data_frame[ticker_col_name]:
-        try:
-            latest_price = intrinio_data.get_daily_stock_close_prices(
-                ticker, price_date, price_date)
+    data_frame['current_price'] = data_frame[ticker_col_name].map(mmt_prices)
 
-            mmt_prices.append(latest_price[price_date.strftime("%Y-%m-%d")])
-        except Exception as e:
-            raise DataError("Could not perform MMT calculation", e)
+    # (current_price - price) / price, computed in place into a single buffer
+    current_prices = data_frame['current_price'].to_numpy(dtype=np.float64)
+    prices = data_frame[price_col_name].to_numpy(dtype=np.float64)
+    actual_returns = np.empty_like(current_prices)
+    np.subtract(current_prices, prices, out=actual_returns)
+    np.divide(actual_returns, prices, out=actual_returns)
 
-    data_frame['current_price'] = mmt_prices
-    data_frame['actual_return'] = (data_frame['current_price'] -
-                                   data_frame[price_col_name]) / data_frame[price_col_name]
+    data_frame['actual_return'] = actual_returns
     return data_frame
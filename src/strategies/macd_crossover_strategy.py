@@ -121,28 +121,39 @@ class MACDCrossoverStrategy(BaseStrategy):
             current_mcd_signal
                 The current macd signal value
         '''
-        macd_col = yfinance.get_macd_column(
-            self.macd_fast_period, self.macd_slow_period)
-        signal_col = yfinance.get_macd_signal_column(
-            self.macd_fast_period, self.macd_slow_period, self.macd_signal_period)
         analisys_date_str = self.analysis_date.strftime("%Y-%m-%d")
 
         # load historical prices
         hist_prices = PricingSvc.get_pricing_dataframe(ticker_symbol)
 
         if hist_prices is None:
-            hist_prices = PricingSvc.load_financial_data(ticker_symbol, self.start_price_date, self.analysis_date)
+            # the strategy only uses closing prices
+            hist_prices = PricingSvc.load_financial_data(
+                ticker_symbol, self.start_price_date, self.analysis_date, close_only=True)
 
-        # Generate MACD lines
-        hist_prices[macd_col]
-        hist_prices[signal_col]
+        macd_col = yfinance.get_macd_column(
+            self.macd_fast_period, self.macd_slow_period)
+        signal_col = yfinance.get_macd_signal_column(
+            self.macd_fast_period, self.macd_slow_period, self.macd_signal_period)
 
         try:
-            latest_price_rec = hist_prices.loc[analisys_date_str]
+            prices = hist_prices.loc[analisys_date_str]
+            # prices are stored as float32
+            current_price = float(prices['Close'])
 
-            current_price = latest_price_rec['Close']
-            macd_line = latest_price_rec[macd_col]
-            signal_line = latest_price_rec[signal_col]
+            preloaded_macd = PricingSvc.get_macd(
+                ticker_symbol, self.analysis_date, self.macd_fast_period,
+                self.macd_slow_period, self.macd_signal_period)
+
+            if preloaded_macd is not None:
+                # computed for all tickers by preload_financial_data()
+                (macd_line, signal_line) = preloaded_macd
+            else:
+                # the default periods are precomputed when the prices are loaded
+                yfinance.add_macd_columns(
+                    hist_prices, self.macd_fast_period, self.macd_slow_period, self.macd_signal_period)
+                prices = hist_prices.loc[analisys_date_str]
+                (macd_line, signal_line) = (float(prices[macd_col]), float(prices[signal_col]))
         except Exception as e:
             raise ValidationError(
                 "Could not read pricing data for %s" % ticker_symbol, e)
@@ -178,12 +189,16 @@ class MACDCrossoverStrategy(BaseStrategy):
             return False
 
     @classmethod
-    def preload_financial_data(cls, ticker_list: object, analysis_date: date, extra_lookback_days: int):
+    def preload_financial_data(cls, ticker_list: object, analysis_date: date, extra_lookback_days: int,
+                               macd_fast_period: int = yfinance.DEFAULT_MACD_FAST_PERIOD,
+                               macd_slow_period: int = yfinance.DEFAULT_MACD_SLOW_PERIOD,
+                               macd_signal_period: int = yfinance.DEFAULT_MACD_SIGNAL_PERIOD):
         '''
             Preload all financial data to support backtesting.
 
             Calling this method before a backtest avoids re-downloading
-            the same pricing data used to compute MACD data
+            the same pricing data used to compute MACD data. The MACD values
+            of all tickers are computed at once for the supplied periods.
 
 
             Parameters
@@ -197,9 +212,11 @@ class MACDCrossoverStrategy(BaseStrategy):
         start_price_date = analysis_date - \
             timedelta(days=extra_lookback_days + cls.REQURIED_PRICE_HISTORY_DAYS)
 
-        for ticker_symbol in ticker_list.ticker_symbols:
-            cls.pricing_dict[ticker_symbol] = yfinance.get_enriched_prices(
-                ticker_symbol, start_price_date, analysis_date)
+        PricingSvc.load_financial_data_bulk(
+            ticker_list.ticker_symbols, start_price_date, analysis_date, close_only=True)
+        PricingSvc.finalize()
+        PricingSvc.load_macd(
+            macd_fast_period, macd_slow_period, macd_signal_period)
 
     def generate_recommendation(self):
         '''
@@ -1,7 +1,13 @@
 """Author: Mark Hanegraaff -- 2020
 """
-from io import BytesIO
+from io import BytesIO, StringIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import atexit
+import functools
+import threading
+import numpy as np
+import pandas as pd
 from diskcache import Cache
 from support import util, constants
 from exception.exceptions import ValidationError
@@ -10,10 +16,36 @@ import logging
 log = logging.getLogger()
 
 
+@functools.lru_cache(maxsize=1024)
+def _disk_key(key: object):
+    '''
+        Returns the string key used by the disk cache. Tuple keys are joined
+        with dashes, e.g. ('yfinance', 'AAPL', 'prices') -> 'yfinance-AAPL-prices'
+    '''
+    if isinstance(key, tuple):
+        return "-".join(str(k) for k in key)
+    return key
+
+
+def _copy_columns(price_df: pd.DataFrame, columns: list):
+    '''
+        Returns a copy of a cached dataframe, limited to the supplied
+        columns when they are specified. Selecting a list of columns
+        already returns a new dataframe, so the full one is never copied.
+    '''
+    if columns is None:
+        return price_df.copy()
+
+    return price_df[[col for col in columns if col in price_df.columns]]
+
+
 class FinancialCache():
     """
         A Disk based database containing an offline version of financial
-        data and used as a cache
+        data and used as a cache.
+
+        Dataframes can also be stored using read_df() and write_df(), which
+        keep the most recently used ones in memory in front of the disk cache.
     """
 
     def __init__(self, path, **kwargs):
@@ -28,6 +60,9 @@ class FinancialCache():
             max_cache_size_bytes : int (kwargs)
             (optional) the maximum size of the cache in bytes
 
+            max_memory_entries : int (kwargs)
+            (optional) the maximum number of dataframes kept in memory
+
             Returns
             -----------
             A tuple of strings containing the start and end date of the fiscal period
@@ -46,6 +81,14 @@ class FinancialCache():
         except Exception as e:
             raise ValidationError('invalid max cache size', e)
 
+        # LRU of the dataframes read or written by this process. Dataframes
+        # are serialized to disk in the background by a single thread, so
+        # writes are applied in order
+        self.max_memory_entries = kwargs.get('max_memory_entries', 1024)
+        self.memory_cache = OrderedDict()
+        self.memory_cache_lock = threading.Lock()
+        self.disk_writer = ThreadPoolExecutor(max_workers=1)
+
         log.debug("Cache was initialized: %s" % path)
 
     def write(self, key: str, value: object):
@@ -72,6 +115,88 @@ class FinancialCache():
             log.debug("%s not found inside cache" % key)
             return None
 
+    def read_df(self, key: object, columns: list = None):
+        """
+            Reads a dataframe from the cache given the supplied key, which
+            can be a string or a tuple. Dataframes are returned from memory
+            when possible, otherwise they are deserialized from disk and
+            kept in memory for subsequent reads.
+
+            Parameters
+            ----------
+            key : object
+                The cache key
+            columns : list
+                (optional) The columns to return. Only these columns are
+                copied, and the ones missing from the cached dataframe
+                are skipped.
+
+            Returns
+            ----------
+            A copy of the dataframe in question, which the caller is free to
+            modify, or None if they key is not present
+        """
+        with self.memory_cache_lock:
+            price_df = self.memory_cache.get(key)
+            if price_df is not None:
+                self.memory_cache.move_to_end(key)
+                return _copy_columns(price_df, columns)
+
+        cached_df = self.read(_disk_key(key))
+
+        if cached_df is None:
+            return None
+        elif isinstance(cached_df, str):
+            # dataframes written before the cache switched to parquet are JSON
+            # strings, indexed by epoch milliseconds. Converting the index
+            # explicitly skips the date inference done by read_json
+            price_df = pd.read_json(StringIO(cached_df), convert_axes=False, convert_dates=False)
+            price_df.index = pd.to_datetime(price_df.index.astype(np.int64), unit='ms',
+                                            cache=True, errors='raise')
+        else:
+            price_df = pd.read_parquet(BytesIO(cached_df))
+
+        self._put_memory(key, price_df)
+        return _copy_columns(price_df, columns)
+
+    def write_df(self, key: object, price_df: pd.DataFrame):
+        """
+            Writes a dataframe to the cache using the supplied key, which
+            can be a string or a tuple. The dataframe is available from memory
+            immediately, and is written to disk as parquet in the background.
+
+            The cache keeps a snapshot of the dataframe, so the caller may
+            continue to modify it.
+        """
+        if (key == "" or key is None) or price_df is None:
+            return
+
+        # the snapshot is never modified, so it can be serialized by the
+        # writer thread while it's being read from memory
+        snapshot_df = price_df.copy()
+
+        self._put_memory(key, snapshot_df)
+        self.disk_writer.submit(self._write_parquet, _disk_key(key), snapshot_df)
+
+    def _put_memory(self, key: object, price_df: pd.DataFrame):
+        with self.memory_cache_lock:
+            self.memory_cache[key] = price_df
+            self.memory_cache.move_to_end(key)
+            while len(self.memory_cache) > self.max_memory_entries:
+                self.memory_cache.popitem(last=False)
+
+    def _write_parquet(self, key: str, price_df: pd.DataFrame):
+        try:
+            self.write(key, price_df.to_parquet())
+        except Exception as e:
+            log.warning("Could not write %s to the cache: %s" % (key, str(e)))
+
+    def flush(self):
+        """
+            Waits for all pending background writes to complete
+        """
+        self.disk_writer.submit(lambda: None).result()
+
 
 @atexit.register
 def shutdown_cache():
@@ -79,6 +204,7 @@ def shutdown_cache():
         Cleanly close the cache when the application exits
     '''
     log.debug("Shutting down cache")
+    cache.disk_writer.shutdown(wait=True)
     cache.disk_cache.close()
 
 # pylint: disable=invalid-name
@@ -3,8 +3,13 @@
 """
 
 import unittest
+import asyncio
+import gzip
+import os
+import tempfile
+from io import BytesIO
 import botocore
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from exception.exceptions import AWSError
 from connectors import aws_service_wrapper
 from support import constants
@@ -21,13 +26,14 @@ class TestConnectorsAWSServiceWrapper(unittest.TestCase):
             or results won't be predictible
         '''
         aws_service_wrapper.aws_response_cache = {}
+        aws_service_wrapper.sns_topic_arn_cache = {}
 
     '''
         list_exports tests
     '''
 
     def test_cf_list_exports_with_boto_exception(self):
-        with patch.object(aws_service_wrapper.CF_CLIENT, 'get_paginator',
+        with patch.object(aws_service_wrapper._cf(), 'list_exports',
                           side_effect=botocore.exceptions.BotoCoreError()):
 
             with self.assertRaises(AWSError):
@@ -35,7 +41,7 @@ class TestConnectorsAWSServiceWrapper(unittest.TestCase):
                     constants.APP_CF_STACK_NAMES)
 
     def test_cf_list_exports_no_data(self):
-        with patch.object(aws_service_wrapper.CF_CLIENT, 'list_exports',
+        with patch.object(aws_service_wrapper._cf(), 'list_exports',
                           return_value={
                               "Exports": []
                           }):
@@ -47,7 +53,7 @@ class TestConnectorsAWSServiceWrapper(unittest.TestCase):
             )
 
     def test_cf_list_exports_none_input(self):
-        with patch.object(aws_service_wrapper.CF_CLIENT, 'list_exports',
+        with patch.object(aws_service_wrapper._cf(), 'list_exports',
                           return_value={
                               "Exports": []
                           }):
@@ -58,7 +64,7 @@ class TestConnectorsAWSServiceWrapper(unittest.TestCase):
             )
 
     def test_cf_list_exports_single_value(self):
-        with patch.object(aws_service_wrapper.CF_CLIENT, 'list_exports',
+        with patch.object(aws_service_wrapper._cf(), 'list_exports',
                           return_value={
                               "Exports": [
                                   {
@@ -77,7 +83,7 @@ class TestConnectorsAWSServiceWrapper(unittest.TestCase):
             )
 
     def test_cf_list_exports_verify_cache(self):
-        with patch.object(aws_service_wrapper.CF_CLIENT, 'list_exports',
+        with patch.object(aws_service_wrapper._cf(), 'list_exports',
                           return_value={
                               "Exports": [
                                   {
@@ -91,8 +97,83 @@ class TestConnectorsAWSServiceWrapper(unittest.TestCase):
 
         self.assertEqual(len(aws_service_wrapper.aws_response_cache), 1)
 
+    def test_cf_list_exports_cache_by_filter(self):
+        with patch.object(aws_service_wrapper._cf(), 'list_exports',
+                          return_value={
+                              "Exports": [
+                                  {
+                                      "ExportingStackId": "arn:aws:cloudformation:us-east-1:acct:stack/app-infra-base/c9481160-6df5-11ea-ac9f-121b58656156",
+                                      "Name": "export-name-1",
+                                      "Value": "export-value-1"
+                                  }]
+                          }):
+
+            self.assertEqual(
+                aws_service_wrapper.cf_list_exports(['app-infra-base']),
+                {"export-name-1": "export-value-1"}
+            )
+            self.assertEqual(
+                aws_service_wrapper.cf_list_exports(['app-infra-compute']),
+                {}
+            )
+
+    def test_cf_list_exports_single_lookup_for_all_filters(self):
+        with patch.object(aws_service_wrapper._cf(), 'list_exports',
+                          return_value={
+                              "Exports": []
+                          }) as mock_list_exports:
+
+            aws_service_wrapper.cf_list_exports(['app-infra-base'])
+            aws_service_wrapper.cf_list_exports(['app-infra-compute'])
+
+        self.assertEqual(mock_list_exports.call_count, 1)
+
+    def test_cf_list_exports_expired_cache(self):
+        with patch.object(aws_service_wrapper._cf(), 'list_exports',
+                          return_value={
+                              "Exports": []
+                          }) as mock_list_exports, \
+            patch.object(aws_service_wrapper, 'AWS_RESPONSE_CACHE_TTL', 0):
+
+            aws_service_wrapper.cf_list_exports(constants.APP_CF_STACK_NAMES)
+            aws_service_wrapper.cf_list_exports(constants.APP_CF_STACK_NAMES)
+
+        self.assertEqual(mock_list_exports.call_count, 2)
+
+    def test_cf_list_exports_multiple_pages(self):
+        with patch.object(aws_service_wrapper._cf(), 'list_exports',
+                          side_effect=[
+                              {
+                                  "Exports": [
+                                      {
+                                          "ExportingStackId": "arn:aws:cloudformation:us-east-1:acct:stack/app-infra-base/c9481160-6df5-11ea-ac9f-121b58656156",
+                                          "Name": "export-name-1",
+                                          "Value": "export-value-1"
+                                      }],
+                                  "NextToken": "token-1"
+                              },
+                              {
+                                  "Exports": [
+                                      {
+                                          "ExportingStackId": "arn:aws:cloudformation:us-east-1:acct:stack/app-infra-compute/c9481160-6df5-11ea-ac9f-121b58656156",
+                                          "Name": "export-name-2",
+                                          "Value": "export-value-2"
+                                      }]
+                              }
+                          ]) as mock_list_exports:
+
+            self.assertEqual(
+                aws_service_wrapper.cf_list_exports(
+                    constants.APP_CF_STACK_NAMES),
+                {
+                    "export-name-1": "export-value-1",
+                    "export-name-2": "export-value-2"
+                }
+            )
+            mock_list_exports.assert_called_with(NextToken="token-1")
+
     def test_cf_list_exports_invalid_arn(self):
-        with patch.object(aws_service_wrapper.CF_CLIENT, 'list_exports',
+        with patch.object(aws_service_wrapper._cf(), 'list_exports',
                           return_value={
                               "Exports": [
                                   {
@@ -111,29 +192,252 @@ class TestConnectorsAWSServiceWrapper(unittest.TestCase):
     '''
 
     def test_s3_download_object_with_boto_exception(self):
-        with patch.object(aws_service_wrapper.S3_CLIENT, 'download_file',
+        with patch.object(aws_service_wrapper._s3(), 'head_object',
                           side_effect=botocore.exceptions.BotoCoreError()):
 
             with self.assertRaises(AWSError):
                 aws_service_wrapper.s3_download_object(
                     "bucket_name", "object_name", "./dest_path")
 
+    def test_s3_download_object_small_object(self):
+        contents = b"small object contents"
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+            patch.object(aws_service_wrapper._s3(), 'head_object',
+                         return_value={'ContentLength': len(contents)}), \
+            patch.object(aws_service_wrapper._s3(), 'get_object',
+                         return_value={
+                             'ContentLength': len(contents),
+                             'Body': BytesIO(contents)
+                         }), \
+            patch.object(aws_service_wrapper._s3(), 'download_file') as mock_download_file:
+
+            dest_path = os.path.join(temp_dir, "object_name")
+            aws_service_wrapper.s3_download_object(
+                "bucket_name", "object_name", dest_path)
+
+            with open(dest_path, 'rb') as f:
+                self.assertEqual(f.read(), contents)
+            self.assertEqual(os.listdir(temp_dir), ["object_name"])
+            mock_download_file.assert_not_called()
+
+            # same permissions as a file created with open()
+            open_path = os.path.join(temp_dir, "open_name")
+            open(open_path, 'wb').close()
+            self.assertEqual(os.stat(dest_path).st_mode, os.stat(open_path).st_mode)
+
+    def test_s3_download_object_interrupted(self):
+        body = MagicMock()
+        body.read.side_effect = [b"partial", botocore.exceptions.BotoCoreError()]
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+            patch.object(aws_service_wrapper._s3(), 'head_object',
+                         return_value={'ContentLength': 100}), \
+            patch.object(aws_service_wrapper._s3(), 'get_object',
+                         return_value={'ContentLength': 100, 'Body': body}):
+
+            dest_path = os.path.join(temp_dir, "object_name")
+            with open(dest_path, 'wb') as f:
+                f.write(b"previous contents")
+
+            with self.assertRaises(AWSError):
+                aws_service_wrapper.s3_download_object(
+                    "bucket_name", "object_name", dest_path)
+
+            # the existing file is left untouched and no temp file remains
+            with open(dest_path, 'rb') as f:
+                self.assertEqual(f.read(), b"previous contents")
+            self.assertEqual(os.listdir(temp_dir), ["object_name"])
+
+    def test_s3_download_object_large_object(self):
+        with patch.object(aws_service_wrapper._s3(), 'head_object',
+                          return_value={
+                              'ContentLength': aws_service_wrapper.TRANSFER_CFG.multipart_threshold
+                          }), \
+            patch.object(aws_service_wrapper._s3(), 'get_object') as mock_get_object, \
+            patch.object(aws_service_wrapper._s3(), 'download_file') as mock_download_file:
+
+            aws_service_wrapper.s3_download_object(
+                "bucket_name", "object_name", "./dest_path")
+
+            mock_download_file.assert_called_once()
+            mock_get_object.assert_not_called()
+
+    def test_s3_upload_many(self):
+        with patch.object(aws_service_wrapper._s3(), 'upload_file',
+                          return_value=None) as mock_upload:
+
+            aws_service_wrapper.s3_upload_many(
+                "bucket_name", [("./file1", "object1"), ("./file2", "object2")])
+
+            self.assertEqual(mock_upload.call_count, 2)
+            # the pool provides the concurrency, so each transfer is single threaded
+            for call in mock_upload.call_args_list:
+                self.assertFalse(call[1]['Config'].use_threads)
+            self.assertLessEqual(aws_service_wrapper.S3_POOL_MAX_WORKERS,
+                                 aws_service_wrapper.CLIENT_CFG.max_pool_connections)
+
+    def test_s3_download_many_with_boto_exception(self):
+        with patch.object(aws_service_wrapper._s3(), 'head_object',
+                          side_effect=botocore.exceptions.BotoCoreError()):
+
+            with self.assertRaises(AWSError):
+                aws_service_wrapper.s3_download_many(
+                    "bucket_name", [("object1", "./file1"), ("object2", "./file2")])
+
     def test_s3_upload_ascii_string_with_boto_exception(self):
-        with patch.object(aws_service_wrapper.S3_CLIENT, 'put_object',
+        with patch.object(aws_service_wrapper._s3(), 'put_object',
                           side_effect=botocore.exceptions.BotoCoreError()):
 
             with self.assertRaises(AWSError):
                 aws_service_wrapper.s3_upload_ascii_string(
                     "some string to upload", "s3_bucket_name", "s3_object_name")
 
+    def test_s3_upload_ascii_string_bytes(self):
+        with patch.object(aws_service_wrapper._s3(), 'put_object',
+                          return_value={}) as mock_put_object:
+
+            aws_service_wrapper.s3_upload_ascii_string(
+                b"some bytes to upload", "s3_bucket_name", "s3_object_name")
+
+            body = mock_put_object.call_args[1]['Body']
+            self.assertEqual(body.read(), b"some bytes to upload")
+            self.assertEqual(mock_put_object.call_args[1]['ContentType'],
+                             'text/plain; charset=us-ascii')
+
+    def test_s3_upload_ascii_string_compressed(self):
+        contents = "x" * (aws_service_wrapper.GZIP_MIN_SIZE_BYTES + 1)
+
+        with patch.object(aws_service_wrapper._s3(), 'put_object',
+                          return_value={}) as mock_put_object:
+
+            aws_service_wrapper.s3_upload_ascii_string(
+                contents, "s3_bucket_name", "s3_object_name", compress=True,
+                content_type='application/json')
+
+            put_args = mock_put_object.call_args[1]
+            self.assertEqual(put_args['ContentEncoding'], 'gzip')
+            self.assertEqual(put_args['ContentType'], 'application/json')
+            self.assertEqual(gzip.decompress(
+                put_args['Body'].read()), contents.encode('ascii'))
+
+    def test_s3_upload_ascii_string_compressed_small_payload(self):
+        with patch.object(aws_service_wrapper._s3(), 'put_object',
+                          return_value={}) as mock_put_object:
+
+            aws_service_wrapper.s3_upload_ascii_string(
+                "small", "s3_bucket_name", "s3_object_name", compress=True)
+
+            self.assertNotIn('ContentEncoding', mock_put_object.call_args[1])
+
+    def test_s3_upload_ascii_string_invalidate(self):
+        with patch.object(aws_service_wrapper._s3(), 'put_object',
+                          return_value={}), \
+            patch.object(aws_service_wrapper._cloudfront(), 'create_invalidation',
+                         return_value={}) as mock_create_invalidation:
+
+            aws_service_wrapper.s3_upload_ascii_string(
+                "some string to upload", "s3_bucket_name", "s3_object_name",
+                invalidate=("distribution_id", ["/s3_object_name"]))
+
+            invalidation_args = mock_create_invalidation.call_args[1]
+            self.assertEqual(
+                invalidation_args['DistributionId'], "distribution_id")
+            self.assertEqual(invalidation_args['InvalidationBatch']['Paths'], {
+                'Quantity': 1,
+                'Items': ["/s3_object_name"]
+            })
+
+    def test_cloudfront_invalidate_with_boto_exception(self):
+        with patch.object(aws_service_wrapper._cloudfront(), 'create_invalidation',
+                          side_effect=botocore.exceptions.BotoCoreError()):
+
+            with self.assertRaises(AWSError):
+                aws_service_wrapper.cloudfront_invalidate(
+                    "distribution_id", ["/s3_object_name"])
+
+    def test_s3_upload_ascii_string_non_ascii(self):
+        with patch.object(aws_service_wrapper._s3(), 'put_object',
+                          return_value={}):
+
+            with self.assertRaises(AWSError):
+                aws_service_wrapper.s3_upload_ascii_string(
+                    "caf\u00e9", "s3_bucket_name", "s3_object_name")
+
+    def test_s3_select(self):
+        with patch.object(aws_service_wrapper._s3(), 'select_object_content',
+                          return_value={
+                              'Payload': [
+                                  {'Records': {'Payload': b'{"a": 1}\n{"a"'}},
+                                  {'Records': {'Payload': b': 2}\n'}},
+                                  {'Stats': {}},
+                                  {'End': {}}
+                              ]
+                          }):
+
+            self.assertEqual(
+                list(aws_service_wrapper.s3_select(
+                    "bucket_name", "object_name", "SELECT s.a FROM S3Object s")),
+                [{"a": 1}, {"a": 2}]
+            )
+
+    def test_s3_select_with_boto_exception(self):
+        with patch.object(aws_service_wrapper._s3(), 'select_object_content',
+                          side_effect=botocore.exceptions.BotoCoreError()):
+
+            with self.assertRaises(AWSError):
+                list(aws_service_wrapper.s3_select(
+                    "bucket_name", "object_name", "SELECT * FROM S3Object s"))
+
     def test_sns_publish_notification_with_boto_exception(self):
-        with patch.object(aws_service_wrapper.SNS_CLIENT, 'publish',
+        with patch.object(aws_service_wrapper._sns(), 'publish',
                           side_effect=botocore.exceptions.BotoCoreError()):
 
             with self.assertRaises(AWSError):
                 aws_service_wrapper.sns_publish_notification(
                     "topic_arn", "subject", "message")
 
+    def test_s3_download_object_async_with_boto_exception(self):
+        with patch.object(aws_service_wrapper._s3(), 'head_object',
+                          side_effect=botocore.exceptions.BotoCoreError()):
+
+            with self.assertRaises(AWSError):
+                asyncio.run(aws_service_wrapper.s3_download_object_async(
+                    "bucket_name", "object_name", "./dest_path"))
+
+    def test_sns_publish_notification_async_concurrent(self):
+        with patch.object(aws_service_wrapper._sns(), 'publish',
+                          return_value={}) as mock_publish:
+
+            async def publish_all():
+                await asyncio.gather(*[
+                    aws_service_wrapper.sns_publish_notification_async(
+                        "topic_arn", "subject", "message %d" % i) for i in range(5)
+                ])
+
+            asyncio.run(publish_all())
+            self.assertEqual(mock_publish.call_count, 5)
+
+    def test_sns_publish_batch(self):
+        with patch.object(aws_service_wrapper._sns(), 'publish_batch',
+                          return_value={'Successful': [], 'Failed': []}) as mock_publish_batch:
+
+            aws_service_wrapper.sns_publish_batch(
+                "topic_arn", [("subject", "message %d" % i) for i in range(25)])
+
+            self.assertEqual(mock_publish_batch.call_count, 3)
+
+    def test_sns_publish_batch_with_failed_entries(self):
+        with patch.object(aws_service_wrapper._sns(), 'publish_batch',
+                          return_value={
+                              'Successful': [],
+                              'Failed': [{'Id': '0', 'Code': 'InternalError', 'SenderFault': False}]
+                          }):
+
+            with self.assertRaises(AWSError):
+                aws_service_wrapper.sns_publish_batch(
+                    "topic_arn", [("subject", "message")])
+
     def test_notify_error_boto_error(self):
         with patch.object(aws_service_wrapper, 'cf_read_export_value',
                           return_value="some_sns_arn"), \
@@ -143,3 +447,16 @@ class TestConnectorsAWSServiceWrapper(unittest.TestCase):
             with self.assertRaises(AWSError):
                 aws_service_wrapper.notify_error(
                     "Security Recommendation Service", Exception("None"), 'stack trace', 'sa')
+
+    def test_notify_error_resolves_topic_once(self):
+        with patch.object(aws_service_wrapper, 'cf_read_export_value',
+                          return_value="some_sns_arn") as mock_read_export_value, \
+            patch.object(aws_service_wrapper, 'sns_publish_notification',
+                         return_value=None) as mock_publish:
+
+            for _ in range(3):
+                aws_service_wrapper.notify_error(
+                    Exception("None"), "Security Recommendation Service", 'stack trace', 'sa')
+
+            self.assertEqual(mock_read_export_value.call_count, 1)
+            self.assertEqual(mock_publish.call_count, 3)
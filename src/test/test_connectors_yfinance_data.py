@@ -0,0 +1,389 @@
+"""Author: Mark Hanegraaff -- 2021
+    Testing class for the connectors.yfinance_data module
+"""
+import unittest
+from unittest.mock import patch, ANY
+from datetime import date
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from connectors import yfinance_data
+from exception.exceptions import DataError
+
+
+class TestConnectorsYFinanceData(unittest.TestCase):
+    """
+        Testing class for the connectors.yfinance_data module
+    """
+
+    price_history = pd.DataFrame({
+        'Open': [10.0, 11.0, 12.0],
+        'High': [10.5, 11.5, 12.5],
+        'Low': [9.5, 10.5, 11.5],
+        'Close': [10.0, 11.0, 12.0],
+        'Volume': [1000, 1100, 1200],
+        'Dividends': [0.0, 0.0, 0.0],
+        'Stock Splits': [0.0, 0.0, 0.0]
+    }, index=pd.DatetimeIndex(['2021-01-04', '2021-01-05', '2021-01-06'], name='Date'))
+
+    def setUp(self):
+        '''
+            make sure to clear out the in memory cache before each test
+            or results won't be predictible
+        '''
+        yfinance_data.cache.memory_cache.clear()
+
+        # cached entries can be written back in the background, so make sure
+        # nothing reaches the disk cache
+        write_patcher = patch.object(yfinance_data.cache, 'write')
+        write_patcher.start()
+        self.addCleanup(write_patcher.stop)
+        self.addCleanup(yfinance_data.cache.flush)
+
+    def test_test_api_endpoint(self):
+        with patch.object(yfinance_data, '_session') as mock_session:
+            yfinance_data.test_api_endpoint()
+
+            mock_session.return_value.head.assert_called_once_with(
+                yfinance_data.YAHOO_HEALTH_CHECK_URL, timeout=5)
+
+    def test_test_api_endpoint_with_exception(self):
+        with patch.object(yfinance_data, '_session') as mock_session:
+            mock_session.return_value.head.side_effect = Exception("Not Found")
+            with self.assertRaises(DataError):
+                yfinance_data.test_api_endpoint()
+
+    def test_test_api_endpoint_with_http_error(self):
+        with patch.object(yfinance_data, '_session') as mock_session:
+            mock_session.return_value.head.return_value.raise_for_status.side_effect = \
+                Exception("503 Server Error")
+            with self.assertRaises(DataError):
+                yfinance_data.test_api_endpoint()
+
+    def test_session_is_shared(self):
+        yfinance_data._session.cache_clear()
+        try:
+            with patch.object(yfinance_data, 'curl_requests', None):
+                session = yfinance_data._session()
+
+                self.assertIs(yfinance_data._session(), session)
+                self.assertEqual(
+                    session.get_adapter('https://query1.finance.yahoo.com')._pool_maxsize,
+                    yfinance_data.HTTP_POOL_SIZE)
+        finally:
+            yfinance_data._session.cache_clear()
+
+    def test_get_enriched_prices_with_exception(self):
+        with patch.object(yfinance_data.cache, 'read', return_value=None), \
+                patch.object(yfinance_data.yf, 'Ticker',
+                             side_effect=Exception("Not Found")):
+            with self.assertRaises(DataError):
+                yfinance_data.get_enriched_prices(
+                    'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+
+    def test_get_enriched_prices_empty_history(self):
+        with patch.object(yfinance_data.cache, 'read', return_value=None), \
+                patch.object(yfinance_data.cache, 'write') as mock_write, \
+                patch.object(yfinance_data.yf, 'Ticker') as mock_ticker:
+            mock_ticker.return_value.history.return_value = self.price_history.iloc[0:0]
+
+            with self.assertRaises(DataError):
+                yfinance_data.get_enriched_prices(
+                    'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+            yfinance_data.cache.flush()
+
+            mock_write.assert_not_called()
+
+    def test_get_enriched_prices_tz_aware_history(self):
+        # Ticker.history() returns dates in the exchange timezone, while
+        # yf.download() returns naive dates
+        history = self.price_history.tz_localize('America/New_York')
+        download_df = pd.concat({'MSFT': self.price_history}, axis=1)
+
+        with patch.object(yfinance_data.cache, 'read', return_value=None), \
+                patch.object(yfinance_data.cache, 'write') as mock_write, \
+                patch.object(yfinance_data.yf, 'Ticker') as mock_ticker, \
+                patch.object(yfinance_data.yf, 'download', return_value=download_df):
+            mock_ticker.return_value.history.return_value = history
+
+            aapl_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+            msft_df = yfinance_data.get_enriched_prices_bulk(
+                ['MSFT'], date(2021, 1, 4), date(2021, 1, 6))['MSFT']
+            yfinance_data.cache.flush()
+
+            cached_df = pd.read_parquet(BytesIO(mock_write.call_args_list[0][0][1]))
+
+        self.assertIsNone(aapl_df.index.tz)
+        self.assertIsNone(cached_df.index.tz)
+        self.assertEqual(aapl_df.index[0], pd.Timestamp('2021-01-04'))
+
+        close_df = pd.concat([aapl_df['Close'], msft_df['Close']], axis=1, sort=True)
+        self.assertEqual(len(close_df), 3)
+
+    def test_get_enriched_prices_tz_aware_cache(self):
+        history = self.price_history.tz_localize('America/New_York')
+
+        with patch.object(yfinance_data.cache, 'read',
+                          return_value=history.to_parquet()):
+            price_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+
+        self.assertIsNone(price_df.index.tz)
+        self.assertEqual(price_df.index[0], pd.Timestamp('2021-01-04'))
+
+    def test_get_enriched_prices_memory_cache(self):
+        with patch.object(yfinance_data.cache, 'read', return_value=None), \
+                patch.object(yfinance_data.cache, 'write'), \
+                patch.object(yfinance_data.yf, 'Ticker') as mock_ticker:
+            mock_ticker.return_value.history.return_value = self.price_history
+
+            price_df_1 = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+            price_df_2 = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+            yfinance_data.cache.flush()
+
+            self.assertTrue(price_df_1.equals(price_df_2))
+            self.assertEqual(mock_ticker.call_count, 1)
+            self.assertEqual(list(price_df_1['Close']), [10.0, 11.0, 12.0])
+
+    def test_get_enriched_prices_caches_indicators(self):
+        with patch.object(yfinance_data.cache, 'read', return_value=None), \
+                patch.object(yfinance_data.cache, 'write') as mock_write, \
+                patch.object(yfinance_data.yf, 'Ticker') as mock_ticker:
+            mock_ticker.return_value.history.return_value = self.price_history
+
+            price_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+            yfinance_data.cache.flush()
+
+            cached_df = pd.read_parquet(BytesIO(mock_write.call_args[0][1]))
+            for col in [yfinance_data.get_macd_column(12, 26),
+                        yfinance_data.get_macd_signal_column(12, 26, 9)]:
+                self.assertIn(col, price_df.columns)
+                self.assertIn(col, cached_df.columns)
+                self.assertNotIn(col, self.price_history.columns)
+
+    def test_get_enriched_prices_float32(self):
+        close = 100 + np.cumsum(np.sin(np.arange(300)))
+        price_history = pd.DataFrame({
+            'Close': close,
+            'Volume': np.full(300, 50000000)
+        }, index=pd.bdate_range('2020-01-01', periods=300, name='Date'))
+
+        with patch.object(yfinance_data.cache, 'read', return_value=None), \
+                patch.object(yfinance_data.cache, 'write'), \
+                patch.object(yfinance_data.yf, 'Ticker') as mock_ticker:
+            mock_ticker.return_value.history.return_value = price_history
+
+            price_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2020, 1, 1), date(2021, 2, 23))
+            yfinance_data.cache.flush()
+
+        self.assertEqual(price_df['Close'].dtype, np.float32)
+        self.assertEqual(price_df['Volume'].iloc[0], 50000000)
+
+        # the MACD is well within the precision needed by the strategy
+        expected_df = yfinance_data.add_macd_columns(price_history.copy(), 12, 26, 9)
+        for col in [yfinance_data.get_macd_column(12, 26),
+                    yfinance_data.get_macd_signal_column(12, 26, 9)]:
+            self.assertTrue(np.allclose(price_df[col], expected_df[col], atol=1e-4))
+
+    def test_get_enriched_prices_not_shared(self):
+        with patch.object(yfinance_data.cache, 'read',
+                          return_value=self.price_history.to_parquet()), \
+                patch.object(yfinance_data.cache, 'write'):
+            price_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+            yfinance_data.macd_crossovers(price_df, 5, 10, 3)
+
+            price_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+            yfinance_data.cache.flush()
+
+        self.assertNotIn(yfinance_data.get_macd_column(5, 10), price_df.columns)
+
+    def test_get_enriched_prices_close_only(self):
+        with patch.object(yfinance_data.cache, 'read',
+                          return_value=self.price_history.to_parquet()):
+            price_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6), close_only=True)
+            full_price_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+
+            self.assertEqual(list(price_df.columns), yfinance_data.CLOSE_ONLY_COLUMNS)
+            self.assertEqual(list(price_df['Close']), [10.0, 11.0, 12.0])
+            # the cached dataframe keeps all columns
+            self.assertIn('Open', full_price_df.columns)
+
+    def test_get_enriched_prices_close_only_cached(self):
+        with patch.object(yfinance_data.cache, 'read',
+                          return_value=self.price_history.to_parquet()):
+            yfinance_data.get_enriched_prices('AAPL', date(2021, 1, 4), date(2021, 1, 6))
+
+        with patch.object(yfinance_data.cache, 'read_df',
+                          wraps=yfinance_data.cache.read_df) as mock_read_df:
+            price_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6), close_only=True)
+
+            # current entries are read with only the selected columns
+            mock_read_df.assert_called_once_with(ANY, yfinance_data.CLOSE_ONLY_COLUMNS)
+            self.assertEqual(list(price_df.columns), yfinance_data.CLOSE_ONLY_COLUMNS)
+
+    def test_get_enriched_prices_parquet_cache(self):
+        with patch.object(yfinance_data.cache, 'read',
+                          return_value=self.price_history.to_parquet()), \
+                patch.object(yfinance_data.yf, 'Ticker') as mock_ticker:
+
+            price_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+
+            mock_ticker.assert_not_called()
+            self.assertEqual(list(price_df['Close']), [10.0, 11.0, 12.0])
+            self.assertEqual(price_df.index[0], pd.Timestamp('2021-01-04'))
+
+    def test_get_enriched_prices_legacy_json_cache(self):
+        with patch.object(yfinance_data.cache, 'read',
+                          return_value=self.price_history.to_json()), \
+                patch.object(yfinance_data.yf, 'Ticker') as mock_ticker:
+
+            price_df = yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+
+            mock_ticker.assert_not_called()
+            self.assertEqual(list(price_df['Close']), [10.0, 11.0, 12.0])
+            self.assertEqual(price_df.index[0], pd.Timestamp('2021-01-04'))
+            self.assertIn(yfinance_data.get_macd_column(12, 26), price_df.columns)
+
+    def test_get_enriched_prices_bulk_partial_cache(self):
+        msft_history = self.price_history.copy()
+        msft_history['Close'] = [20.0, 21.0, 22.0]
+        download_df = pd.concat({'MSFT': msft_history}, axis=1)
+
+        def read_cache(key):
+            if '-AAPL-' in key:
+                return self.price_history.to_parquet()
+            return None
+
+        with patch.object(yfinance_data.cache, 'read', side_effect=read_cache), \
+                patch.object(yfinance_data.cache, 'write') as mock_write, \
+                patch.object(yfinance_data.yf, 'download',
+                             return_value=download_df) as mock_download:
+
+            price_dict = yfinance_data.get_enriched_prices_bulk(
+                ['AAPL', 'MSFT'], date(2021, 1, 4), date(2021, 1, 6))
+            yfinance_data.cache.flush()
+
+            self.assertEqual(mock_download.call_count, 1)
+            self.assertEqual(mock_download.call_args[0][0], ['MSFT'])
+            # the AAPL entry predates the indicator columns, so it's upgraded
+            # and written back along with the MSFT prices
+            self.assertEqual(sorted(call[0][0] for call in mock_write.call_args_list),
+                             ['yfinance-AAPL-2021-01-04-2021-01-07-prices',
+                              'yfinance-MSFT-2021-01-04-2021-01-07-prices'])
+            self.assertEqual(list(price_dict['AAPL']['Close']), [10.0, 11.0, 12.0])
+            self.assertEqual(list(price_dict['MSFT']['Close']), [20.0, 21.0, 22.0])
+
+    def test_get_enriched_prices_bulk_missing_ticker(self):
+        download_df = pd.concat({'AAPL': self.price_history,
+                                 'BADTICKER': self.price_history * np.nan}, axis=1)
+
+        with patch.object(yfinance_data.cache, 'read', return_value=None), \
+                patch.object(yfinance_data.cache, 'write'), \
+                patch.object(yfinance_data.yf, 'download',
+                             return_value=download_df):
+            with self.assertRaises(DataError):
+                yfinance_data.get_enriched_prices_bulk(
+                    ['AAPL', 'BADTICKER'], date(2021, 1, 4), date(2021, 1, 6))
+            yfinance_data.cache.flush()
+
+    def test_get_enriched_prices_bulk_with_exception(self):
+        with patch.object(yfinance_data.cache, 'read', return_value=None), \
+                patch.object(yfinance_data.yf, 'download',
+                             side_effect=Exception("Not Found")):
+            with self.assertRaises(DataError):
+                yfinance_data.get_enriched_prices_bulk(
+                    ['AAPL'], date(2021, 1, 4), date(2021, 1, 6))
+
+    def test_get_enriched_prices_cache_key(self):
+        with patch.object(yfinance_data.cache, 'read',
+                          return_value=self.price_history.to_parquet()) as mock_read:
+            yfinance_data.get_enriched_prices(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 6))
+
+            mock_read.assert_called_once_with(
+                'yfinance-AAPL-2021-01-04-2021-01-07-prices')
+            self.assertIn(('yfinance', 'AAPL', '2021-01-04', '2021-01-07', 'prices'),
+                          yfinance_data.cache.memory_cache)
+
+    def test_ema(self):
+        values = np.array([10.0, 11.0, 12.0, 11.0, 13.0])
+
+        self.assertTrue(np.allclose(
+            yfinance_data._ema(values, 0.5),
+            pd.Series(values).ewm(alpha=0.5, adjust=False).mean().to_numpy()
+        ))
+
+    def test_ema_empty(self):
+        self.assertEqual(len(yfinance_data._ema(np.array([]), 0.5)), 0)
+
+    def test_ema_matrix(self):
+        values = np.array([[10.0, 11.0, 12.0, 11.0, 13.0],
+                           [np.nan, np.nan, 12.0, 11.0, 13.0],
+                           [10.0, 11.0, np.nan, 11.0, 13.0]], dtype=np.float32)
+
+        ema = yfinance_data.ema_matrix(values, 0.5)
+
+        self.assertEqual(ema.dtype, np.float32)
+        self.assertTrue(np.allclose(ema[0], yfinance_data._ema(values[0], 0.5)))
+        self.assertTrue(np.isnan(ema[1][:2]).all())
+        self.assertTrue(np.allclose(ema[1][2:], yfinance_data._ema(values[1][2:], 0.5)))
+        # a missing price carries the average forward
+        self.assertTrue(np.allclose(
+            np.delete(ema[2], 2), yfinance_data._ema(np.delete(values[2], 2), 0.5)))
+
+    def test_add_macd_columns(self):
+        price_df = self.price_history.copy()
+        close = price_df['Close']
+
+        yfinance_data.add_macd_columns(price_df, 12, 26, 9)
+
+        expected_macd = close.ewm(span=12, adjust=False).mean() - \
+            close.ewm(span=26, adjust=False).mean()
+        expected_signal = expected_macd.ewm(span=9, adjust=False).mean()
+
+        self.assertTrue(np.allclose(
+            price_df[yfinance_data.get_macd_column(12, 26)], expected_macd))
+        self.assertTrue(np.allclose(
+            price_df[yfinance_data.get_macd_signal_column(12, 26, 9)], expected_signal))
+
+    def test_macd_crossovers(self):
+        price_df = pd.DataFrame({
+            yfinance_data.get_macd_column(12, 26): [1.0, 2.0, 1.0, -1.0, -2.0, 1.0],
+            yfinance_data.get_macd_signal_column(12, 26, 9): [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        })
+
+        self.assertEqual(
+            list(yfinance_data.macd_crossovers(price_df, 12, 26, 9)), [3, 5])
+
+    def test_ema_tail(self):
+        values = np.array([10.0, 11.0, 12.0, 11.0, 13.0])
+
+        self.assertAlmostEqual(
+            yfinance_data._ema_tail(values, 0.5, len(values) - 1),
+            yfinance_data._ema(values, 0.5)[-1]
+        )
+
+    def test_get_latest_macd(self):
+        close = pd.Series(100 + np.cumsum(np.sin(np.arange(300) / 10)))
+        price_df = pd.DataFrame({'Close': close})
+
+        yfinance_data.add_macd_columns(price_df, 12, 26, 9)
+        (macd, signal) = yfinance_data.get_latest_macd(
+            close.to_numpy(), 12, 26, 9)
+
+        self.assertAlmostEqual(
+            macd, price_df[yfinance_data.get_macd_column(12, 26)].iloc[-1], places=4)
+        self.assertAlmostEqual(
+            signal, price_df[yfinance_data.get_macd_signal_column(12, 26, 9)].iloc[-1], places=4)
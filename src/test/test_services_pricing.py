@@ -0,0 +1,136 @@
+"""Author: Mark Hanegraaff -- 2021
+    Testing class for the services.pricing_svc module
+"""
+import unittest
+import warnings
+import numpy as np
+import pandas as pd
+from unittest.mock import patch
+from datetime import date
+from connectors import yfinance_data
+from services.pricing_svc import PricingSvc
+
+
+class TestServicesPricing(unittest.TestCase):
+
+    """
+        Testing class for the services.pricing_svc module
+    """
+
+    def setUp(self):
+        '''
+            make sure to clear out the loaded prices before each test
+            or results won't be predictible
+        '''
+        PricingSvc.pricing_dict = {}
+        PricingSvc.ticker_index = {}
+        PricingSvc.macd_dict = {}
+
+    def test_load_financial_data(self):
+        price_df = pd.DataFrame({'Close': [1.0, 2.0]})
+
+        with patch.object(yfinance_data, 'get_enriched_prices',
+                          return_value=price_df):
+            self.assertIs(PricingSvc.load_financial_data(
+                'AAPL', date(2021, 1, 4), date(2021, 1, 5)), price_df)
+            self.assertIs(PricingSvc.get_pricing_dataframe('AAPL'), price_df)
+
+    def test_load_financial_data_bulk(self):
+        price_dict = {
+            'AAPL': pd.DataFrame({'Close': [1.0, 2.0]}),
+            'MSFT': pd.DataFrame({'Close': [3.0, 4.0]})
+        }
+
+        with patch.object(yfinance_data, 'get_enriched_prices_bulk',
+                          return_value=price_dict) as mock_bulk:
+            PricingSvc.load_financial_data_bulk(
+                ['AAPL', 'MSFT'], date(2021, 1, 4), date(2021, 1, 5))
+
+            self.assertEqual(mock_bulk.call_count, 1)
+            self.assertIs(PricingSvc.get_pricing_dataframe('AAPL'), price_dict['AAPL'])
+            self.assertIs(PricingSvc.get_pricing_dataframe('MSFT'), price_dict['MSFT'])
+
+    def test_finalize(self):
+        PricingSvc.pricing_dict = {
+            'AAPL': pd.DataFrame({'Close': [1.0, 2.0]},
+                                 index=pd.DatetimeIndex(['2021-01-04', '2021-01-05'])),
+            'MSFT': pd.DataFrame({'Close': [3.0, 4.0]},
+                                 index=pd.DatetimeIndex(['2021-01-05', '2021-01-06']))
+        }
+
+        PricingSvc.finalize()
+
+        self.assertEqual(PricingSvc.close_prices.shape, (2, 3))
+        self.assertEqual(PricingSvc.close_prices.dtype, np.float32)
+        self.assertEqual(len(PricingSvc.price_dates), 3)
+        self.assertTrue(np.array_equal(
+            PricingSvc.get_close_prices('AAPL'), [1.0, 2.0, np.nan], equal_nan=True))
+        self.assertTrue(np.array_equal(
+            PricingSvc.get_close_prices('MSFT'), [np.nan, 3.0, 4.0], equal_nan=True))
+        self.assertIsNone(PricingSvc.get_close_prices('GE'))
+
+    def test_finalize_sorts_dates(self):
+        PricingSvc.pricing_dict = {
+            'MSFT': pd.DataFrame({'Close': [3.0, 4.0]},
+                                 index=pd.DatetimeIndex(['2021-01-05', '2021-01-06'])),
+            'AAPL': pd.DataFrame({'Close': [1.0, 2.0]},
+                                 index=pd.DatetimeIndex(['2021-01-04', '2021-01-05']))
+        }
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            PricingSvc.finalize()
+
+        self.assertTrue(PricingSvc.price_dates.is_monotonic_increasing)
+        self.assertTrue(np.array_equal(
+            PricingSvc.get_close_prices('MSFT'), [np.nan, 3.0, 4.0], equal_nan=True))
+
+    def test_finalize_no_prices(self):
+        PricingSvc.finalize()
+
+        self.assertEqual(PricingSvc.close_prices.shape, (0, 0))
+        self.assertIsNone(PricingSvc.get_close_prices('AAPL'))
+
+    def test_get_macd(self):
+        # cached prices are stored as float32
+        close = (100 + np.cumsum(np.sin(np.arange(60)))).astype(np.float32)
+        price_dates = pd.bdate_range('2021-01-04', periods=60)
+
+        PricingSvc.pricing_dict = {
+            'AAPL': pd.DataFrame({'Close': close}, index=price_dates),
+            'MSFT': pd.DataFrame({'Close': close[10:]}, index=price_dates[10:])
+        }
+        PricingSvc.finalize()
+        PricingSvc.load_macd(12, 26, 9)
+
+        expected_df = yfinance_data.add_macd_columns(
+            PricingSvc.pricing_dict['MSFT'].copy(), 12, 26, 9)
+        (macd, signal) = PricingSvc.get_macd('MSFT', price_dates[-1].date(), 12, 26, 9)
+
+        # computed in float64, like add_macd_columns()
+        self.assertAlmostEqual(macd, expected_df['macd_12_26'].iloc[-1], places=10)
+        self.assertAlmostEqual(signal, expected_df['macd_signal_12_26_9'].iloc[-1], places=10)
+
+        # MSFT has no price, and there is no price on a weekend
+        self.assertIsNone(PricingSvc.get_macd('MSFT', price_dates[0].date(), 12, 26, 9))
+        self.assertIsNone(PricingSvc.get_macd('AAPL', date(2021, 1, 9), 12, 26, 9))
+        self.assertIsNone(PricingSvc.get_macd('AAPL', price_dates[-1].date(), 5, 10, 3))
+        self.assertIsNone(PricingSvc.get_macd('GE', price_dates[-1].date(), 12, 26, 9))
+
+    def test_get_macd_tz_aware(self):
+        close = 100 + np.cumsum(np.sin(np.arange(60)))
+        price_dates = pd.bdate_range('2021-01-04', periods=60, tz='America/New_York')
+
+        PricingSvc.pricing_dict = {
+            'AAPL': pd.DataFrame({'Close': close}, index=price_dates)
+        }
+        PricingSvc.finalize()
+        PricingSvc.load_macd(12, 26, 9)
+
+        expected_df = yfinance_data.add_macd_columns(
+            PricingSvc.pricing_dict['AAPL'].copy(), 12, 26, 9)
+        (macd, signal) = PricingSvc.get_macd('AAPL', date(2021, 3, 26), 12, 26, 9)
+
+        self.assertAlmostEqual(macd, expected_df['macd_12_26'].iloc[-1], places=4)
+        self.assertAlmostEqual(signal, expected_df['macd_signal_12_26_9'].iloc[-1], places=4)
+        self.assertIsNone(PricingSvc.get_macd('AAPL', date(2021, 3, 27), 12, 26, 9))
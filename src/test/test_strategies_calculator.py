@@ -4,8 +4,9 @@
 import unittest
 from unittest.mock import patch
 from datetime import date
+import numpy as np
 import pandas as pd
-from connectors import intrinio_data
+from connectors import yfinance_data
 from exception.exceptions import CalculationError, ValidationError, DataError
 from strategies import calculator
 
@@ -16,6 +17,23 @@ class TestStrategiesCalculator(unittest.TestCase):
         Testing class for the strategies.calculator module
     """
 
+    @staticmethod
+    def close_prices(price: float):
+        return pd.DataFrame({'Close': [price]},
+                            index=pd.DatetimeIndex(['2020-10-22'], name='Date'))
+
+    def test_mark_to_market_missing_price(self):
+        df_dict = {
+            'ticker': ['a'],
+            'analysis_price': [10]
+        }
+        data_frame = pd.DataFrame(df_dict)
+        with patch.object(yfinance_data, 'get_enriched_prices_bulk',
+                          return_value={'a': self.close_prices(20)}):
+            with self.assertRaises(DataError):
+                calculator.mark_to_market(
+                    data_frame, 'ticker', 'analysis_price', date(2020, 10, 23))
+
     def test_mark_to_market_null_parameters(self):
         df_dict = {
             'ticker': ['a', 'b', 'c', 'd'],
@@ -44,8 +62,8 @@ class TestStrategiesCalculator(unittest.TestCase):
             'analysis_price': [10]
         }
         data_frame = pd.DataFrame(df_dict)
-        with patch.object(intrinio_data, 'get_daily_stock_close_prices',
-                          return_value=({'2020-10-22': 20})):
+        with patch.object(yfinance_data, 'get_enriched_prices_bulk',
+                          return_value={'a': self.close_prices(20)}):
 
             mmt_df = calculator.mark_to_market(
                 data_frame, 'ticker', 'analysis_price', date(2020, 10, 22))
@@ -53,14 +71,50 @@ class TestStrategiesCalculator(unittest.TestCase):
             self.assertEqual(mmt_df['current_price'][0], 20)
             self.assertEqual(mmt_df['actual_return'][0], 1.0)
 
+    def test_mark_to_market_float32_price(self):
+        df_dict = {
+            'ticker': ['a'],
+            'analysis_price': [10]
+        }
+        data_frame = pd.DataFrame(df_dict)
+        price_df = self.close_prices(20.5).astype(np.float32)
+        with patch.object(yfinance_data, 'get_enriched_prices_bulk',
+                          return_value={'a': price_df}):
+
+            mmt_df = calculator.mark_to_market(
+                data_frame, 'ticker', 'analysis_price', date(2020, 10, 22))
+
+            self.assertEqual(mmt_df['current_price'].dtype, np.float64)
+            self.assertEqual(mmt_df['current_price'][0], 20.5)
+            self.assertEqual(mmt_df['actual_return'][0], 1.05)
+
+    def test_mark_to_market_multiple_tickers(self):
+        df_dict = {
+            'ticker': ['a', 'b', 'c', 'a'],
+            'analysis_price': [10, 20, 40, 20]
+        }
+        prices = {'a': self.close_prices(20), 'b': self.close_prices(10),
+                  'c': self.close_prices(50)}
+        data_frame = pd.DataFrame(df_dict)
+        with patch.object(yfinance_data, 'get_enriched_prices_bulk',
+                          return_value=prices) as mock_bulk:
+
+            mmt_df = calculator.mark_to_market(
+                data_frame, 'ticker', 'analysis_price', date(2020, 10, 22))
+
+            mock_bulk.assert_called_once_with(
+                ['a', 'b', 'c'], date(2020, 10, 22), date(2020, 10, 22), close_only=True)
+            self.assertEqual(list(mmt_df['current_price']), [20, 10, 50, 20])
+            self.assertEqual(list(mmt_df['actual_return']), [1.0, -0.5, 0.25, 0.0])
+
     def test_mark_to_market_price_exception(self):
         df_dict = {
             'ticker': ['a'],
             'analysis_price': [10]
         }
         data_frame = pd.DataFrame(df_dict)
-        with patch.object(intrinio_data, 'get_daily_stock_close_prices',
-                          side_effect=Exception("Not Found")):
+        with patch.object(yfinance_data, 'get_enriched_prices_bulk',
+                          side_effect=DataError("Not Found", None)):
             with self.assertRaises(DataError):
                 calculator.mark_to_market(
                     data_frame, 'ticker', 'analysis_price', date.today())
@@ -3,6 +3,7 @@
 """
 import unittest
 import shutil
+import pandas as pd
 from support.financial_cache import FinancialCache
 from exception.exceptions import ValidationError, FileSystemError
 
@@ -103,3 +104,84 @@ class TestFinancialCache(unittest.TestCase):
 
         finally:
             shutil.rmtree(small_cache_path)
+
+    def test_write_df(self):
+        key = ('test', 'df', 'write')
+        value = pd.DataFrame({'Close': [1.0, 2.0]},
+                             index=pd.DatetimeIndex(['2021-01-04', '2021-01-05']))
+
+        self.test_cache.write_df(key, value)
+        self.assertTrue(self.test_cache.read_df(key).equals(value))
+
+        self.test_cache.flush()
+        self.test_cache.memory_cache.clear()
+
+        # the dataframe is deserialized from disk
+        cached_df = self.test_cache.read_df(key)
+        self.assertIsNot(cached_df, value)
+        self.assertTrue(cached_df.equals(value))
+        self.assertIsNotNone(self.test_cache.read('test-df-write'))
+
+    def test_read_df_legacy_json(self):
+        key = 'test-df-json'
+        value = pd.DataFrame({'Close': [1.5, 2.5]},
+                             index=pd.DatetimeIndex(['2021-01-04', '2021-01-05']))
+
+        self.test_cache.write(key, value.to_json())
+
+        cached_df = self.test_cache.read_df(key)
+        self.assertEqual(list(cached_df['Close']), [1.5, 2.5])
+        self.assertEqual(cached_df.index[0], pd.Timestamp('2021-01-04'))
+
+    def test_read_df_not_found(self):
+        self.assertEqual(self.test_cache.read_df(('not', 'found')), None)
+
+    def test_read_df_returns_copy(self):
+        key = ('test', 'df', 'copy')
+        value = pd.DataFrame({'Close': [1.0, 2.0]})
+
+        self.test_cache.write_df(key, value)
+        value['Open'] = [0.5, 1.5]
+
+        cached_df = self.test_cache.read_df(key)
+        cached_df['High'] = [1.5, 2.5]
+        cached_df.loc[0, 'Close'] = 100.0
+
+        self.assertEqual(list(self.test_cache.read_df(key).columns), ['Close'])
+        self.assertEqual(self.test_cache.read_df(key)['Close'].iloc[0], 1.0)
+        self.test_cache.flush()
+
+    def test_read_df_columns(self):
+        key = ('test', 'df', 'columns')
+        value = pd.DataFrame({'Open': [0.5, 1.5], 'Close': [1.0, 2.0]})
+
+        self.test_cache.write_df(key, value)
+
+        cached_df = self.test_cache.read_df(key, ['Close', 'Volume'])
+        cached_df.loc[0, 'Close'] = 100.0
+
+        self.assertEqual(list(cached_df.columns), ['Close'])
+        self.assertEqual(list(self.test_cache.read_df(key).columns), ['Open', 'Close'])
+        self.assertEqual(self.test_cache.read_df(key)['Close'].iloc[0], 1.0)
+        self.test_cache.flush()
+
+    def test_memory_cache_lru(self):
+        small_cache_path = "./test/cache-unittest-lru/"
+        lru_cache = FinancialCache(small_cache_path, max_memory_entries=2)
+
+        try:
+            for key in ['a', 'b', 'c']:
+                lru_cache.write_df(key, pd.DataFrame({'Close': [1.0]}))
+                if key == 'b':
+                    # 'a' becomes the most recently used entry
+                    lru_cache.read_df('a')
+
+            self.assertEqual(list(lru_cache.memory_cache.keys()), ['a', 'c'])
+
+            # evicted entries are still read from disk
+            lru_cache.flush()
+            self.assertIsNotNone(lru_cache.read_df('b'))
+        finally:
+            lru_cache.disk_writer.shutdown(wait=True)
+            lru_cache.disk_cache.close()
+            shutil.rmtree(small_cache_path)
@@ -29,6 +29,14 @@ def main():
     '''
         Main testing script
     '''
+    parser = argparse.ArgumentParser(description="General purpose test script")
+    parser.add_argument("-debug", help="Display dataframes without truncating rows or columns",
+                        action="store_true")
+    args = parser.parse_args()
+
+    if args.debug:
+        pd.set_option("display.max_rows", None, "display.max_columns", None)
+
     try:
 
         ticker_list = TickerList.from_local_file(
@@ -40,9 +48,10 @@ def main():
         analysis_date = date(2021, 5, 7)
         start_price_date = analysis_date - timedelta(days=400)
 
-        # Preload prices
-        for ticker in ticker_list.ticker_symbols:
-            PricingSvc.load_financial_data(ticker, start_price_date, analysis_date)
+        # Preload prices using a single download
+        PricingSvc.load_financial_data_bulk(
+            ticker_list.ticker_symbols, start_price_date, analysis_date, close_only=True)
+        PricingSvc.finalize()
 
 
         #macd_strategy = MACDCrossoverStrategy.from_configur    ation(config, 'sa')